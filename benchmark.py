@@ -0,0 +1,245 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+import numpy as np
+
+import codec
+from candles import CandleSeries
+from commands.request import Candle
+from commands.streaming import streaming_record_classes
+from mock_server import (
+    MockXTBServer,
+    synthetic_balances,
+    synthetic_candles,
+    synthetic_profits,
+)
+from xtbapi import XTB
+
+SUITES = ("decode", "stream", "commands", "memory")
+
+# results where a larger value is better; everything else is a cost
+HIGHER_IS_BETTER = ("_per_s",)
+
+
+def percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else float("nan")
+
+
+def bench_decode(count: int) -> Dict[str, float]:
+    # codec.loads plus record construction, per available codec and stream
+    messages = {
+        "candle": list(synthetic_candles("EURUSD", count)),
+        "profit": list(synthetic_profits(count)),
+        "balance": list(synthetic_balances(count)),
+    }
+    results = {}
+    for name, codec_class in codec.CODECS.items():
+        try:
+            decoder = codec_class()
+        except ImportError:
+            continue
+        for stream, pairs in messages.items():
+            raw = [
+                decoder.dumps({"command": command, "data": data})
+                for command, data in pairs
+            ]
+            started = time.perf_counter()
+            for message in raw:
+                message = decoder.loads(message)
+                streaming_record_classes[message["command"]].from_wire(message["data"])
+            elapsed = time.perf_counter() - started
+            results[f"decode_{name}_{stream}_msgs_per_s"] = count / elapsed
+    return results
+
+
+async def bench_stream(count: int, rate: Optional[float]) -> Dict[str, float]:
+    # mock server to callback: decoded message rate and dispatch latency
+    async with MockXTBServer() as server:
+        xtb = XTB(health_check_interval=None, max_streamed_candles=count)
+        server.attach(xtb)
+        await xtb.login("benchmark", "benchmark")
+
+        sent_at: Dict[int, float] = {}
+        latencies: List[float] = []
+        done = asyncio.Event()
+
+        async def on_candle(candle: Candle):
+            latencies.append(time.perf_counter() - sent_at.pop(candle.ctm))
+            if len(latencies) == count:
+                done.set()
+
+        try:
+            await xtb.startCandleStream("EURUSD", on_candle, maxsize=count)
+            await server.wait_subscribed("candle", "EURUSD")
+
+            started = time.perf_counter()
+            await server.replay(
+                synthetic_candles("EURUSD", count),
+                rate=rate,
+                on_send=lambda command, data: sent_at.__setitem__(
+                    data["ctm"], time.perf_counter()
+                ),
+            )
+            await asyncio.wait_for(done.wait(), 60)
+            elapsed = time.perf_counter() - started
+        finally:
+            await xtb.disconnect()
+
+    return {
+        "stream_msgs_per_s": count / elapsed,
+        "dispatch_latency_p50_s": percentile(latencies, 50),
+        "dispatch_latency_p99_s": percentile(latencies, 99),
+        "dispatch_latency_max_s": max(latencies),
+    }
+
+
+async def bench_commands(
+    count: int, latency: float, pool_size: int
+) -> Dict[str, float]:
+    async with MockXTBServer(latency=latency) as server:
+        xtb = XTB(
+            request_rate=1e9,
+            request_burst=count,
+            pool_size=pool_size,
+            health_check_interval=None,
+        )
+        server.attach(xtb)
+        await xtb.login("benchmark", "benchmark")
+
+        try:
+            started = time.perf_counter()
+            await asyncio.gather(*[xtb.getServerTime() for _ in range(count)])
+            elapsed = time.perf_counter() - started
+        finally:
+            await xtb.disconnect()
+        histogram = xtb.metrics.histogram(
+            "xtb_command_seconds", command="getServerTime"
+        )
+
+    return {
+        "commands_per_s": count / elapsed,
+        "command_rtt_p50_s": histogram.quantile(0.5),
+        "command_rtt_p99_s": histogram.quantile(0.99),
+    }
+
+
+def bench_memory(count: int) -> Dict[str, float]:
+    ctm = np.arange(count, dtype=np.int64) * 60_000
+    prices = np.random.default_rng(0).random(count)
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    series = CandleSeries("EURUSD", capacity=1)
+    for start in range(0, count, 10_000):
+        chunk = slice(start, start + 10_000)
+        series.extend(
+            ctm[chunk],
+            prices[chunk],
+            prices[chunk],
+            prices[chunk],
+            prices[chunk],
+            prices[chunk],
+        )
+    series_bytes = tracemalloc.get_traced_memory()[0] - before
+
+    # records are measured on a sample and scaled
+    sample = min(count, 100_000)
+    before = tracemalloc.get_traced_memory()[0]
+    records = [
+        Candle(
+            symbol="EURUSD",
+            ctm=int(ctm[i]),
+            open=float(prices[i]),
+            high=float(prices[i]),
+            low=float(prices[i]),
+            close=float(prices[i]),
+            vol=float(prices[i]),
+        )
+        for i in range(sample)
+    ]
+    record_bytes = (tracemalloc.get_traced_memory()[0] - before) * count / sample
+    tracemalloc.stop()
+    del series, records
+
+    return {
+        "candle_series_bytes_per_1m": series_bytes * 1_000_000 / count,
+        "candle_records_bytes_per_1m": record_bytes * 1_000_000 / count,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    regressions = []
+    for name, value in results.items():
+        previous = baseline.get(name)
+        if not previous or value != value:
+            continue
+        if name.endswith(HIGHER_IS_BETTER):
+            change = (previous - value) / previous
+        else:
+            change = (value - previous) / previous
+        if change > tolerance:
+            regressions.append(f"{name}: {previous:.6g} -> {value:.6g}")
+    return regressions
+
+
+async def run(args) -> dict:
+    results = {}
+    if "decode" in args.suites:
+        results.update(bench_decode(args.messages))
+    if "stream" in args.suites:
+        results.update(await bench_stream(args.messages, args.rate))
+    if "commands" in args.suites:
+        results.update(
+            await bench_commands(args.commands, args.latency, args.pool_size)
+        )
+    if "memory" in args.suites:
+        results.update(bench_memory(args.candles))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Offline benchmarks against a mock XTB server"
+    )
+    parser.add_argument("suites", nargs="*", help=f"any of {', '.join(SUITES)}")
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument(
+        "--rate", type=float, default=None, help="stream messages per second"
+    )
+    parser.add_argument("--commands", type=int, default=5_000)
+    parser.add_argument("--latency", type=float, default=0, help="mock command latency")
+    parser.add_argument("--pool-size", type=int, default=1)
+    parser.add_argument("--candles", type=int, default=1_000_000)
+    parser.add_argument("--save", help="write the results to a JSON file")
+    parser.add_argument("--baseline", help="compare against saved results")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    for suite in args.suites:
+        if suite not in SUITES:
+            parser.error(f"Unknown suite: {suite}")
+    args.suites = args.suites or SUITES
+
+    results = asyncio.run(run(args))
+    for name, value in results.items():
+        print(f"{name:45} {value:.6g}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import os
+import time
+from typing import List, Optional, Tuple
+from urllib.parse import quote
+import numpy as np
+
+from candles import COLUMNS, MINUTE, CandleSeries
+
+CANDLE_DTYPE = np.dtype(
+    [("ctm", "<i8")] + [(name, "<f8") for name in COLUMNS if name != "ctm"]
+)
+
+CACHE_SUFFIX = ".candles"
+# sidecar with the [start, end) milliseconds fetched into a cache file
+COVERAGE_SUFFIX = ".covered"
+
+
+class CandleCache:
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: Optional[int] = None,
+        max_age: Optional[float] = None,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, symbol: str, period: int) -> str:
+        return os.path.join(
+            self.directory, f"{quote(symbol, safe='')}_{period}{CACHE_SUFFIX}"
+        )
+
+    def __records(self, symbol: str, period: int) -> Optional[np.ndarray]:
+        path = self.path(symbol, period)
+        if not os.path.exists(path) or not os.path.getsize(path):
+            return None
+        # file access time is not reliable on every filesystem, so touch the
+        # file to keep eviction least-recently-used
+        os.utime(path)
+        return np.memmap(path, dtype=CANDLE_DTYPE, mode="r")
+
+    def range(self, symbol: str, period: int) -> Optional[Tuple[int, int]]:
+        records = self.__records(symbol, period)
+        if records is None:
+            return None
+        return int(records["ctm"][0]), int(records["ctm"][-1])
+
+    def coverage(self, symbol: str, period: int) -> Optional[Tuple[int, int]]:
+        # the fetched range, which reaches past the bars over weekends and
+        # where the server had no older history
+        records = self.__records(symbol, period)
+        if records is None:
+            return None
+        start = int(records["ctm"][0])
+        end = int(records["ctm"][-1]) + period * MINUTE
+        path = self.path(symbol, period) + COVERAGE_SUFFIX
+        if os.path.exists(path):
+            covered = np.fromfile(path, dtype="<i8")
+            if len(covered) == 2:
+                start, end = min(start, int(covered[0])), max(end, int(covered[1]))
+        return start, end
+
+    def __cover(self, path: str, start: int, end: int):
+        temporary = path + COVERAGE_SUFFIX + ".tmp"
+        np.array([start, end], dtype="<i8").tofile(temporary)
+        os.replace(temporary, path + COVERAGE_SUFFIX)
+
+    def load(
+        self,
+        symbol: str,
+        period: int,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+    ) -> Optional[CandleSeries]:
+        records = self.__records(symbol, period)
+        if records is None:
+            return None
+
+        ctm = records["ctm"]
+        first = 0 if start is None else int(np.searchsorted(ctm, start, "left"))
+        last = len(ctm) if end is None else int(np.searchsorted(ctm, end, "left"))
+        window = records[first:last]
+        return CandleSeries.from_columns(
+            symbol, period, **{name: window[name] for name in COLUMNS}
+        )
+
+    def missing_ranges(
+        self, symbol: str, period: int, start: int, end: Optional[int] = None
+    ) -> List[Tuple[int, Optional[int]]]:
+        # the cache always holds one contiguous block, so only the head and
+        # the tail can be missing; the last cached bar may still have been
+        # forming, so the tail is refetched from it. A start past the cached
+        # block still fetches from it, or the block would get a hole. The
+        # head is only missing before the earliest start already fetched,
+        # since the server keeps no older history for some periods
+        cached = self.range(symbol, period)
+        if cached is None:
+            return [(start, end)]
+
+        first, last = cached
+        covered = self.coverage(symbol, period)
+        missing = []
+        if start < covered[0]:
+            missing.append((start, covered[0]))
+        if end is None or end > last + period * MINUTE:
+            missing.append((last, end))
+        return missing
+
+    def store(
+        self,
+        series: CandleSeries,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+    ):
+        # start and end are the range that was fetched for the series. The
+        # file holds one block without holes, so data whose range does not
+        # touch the cached one replaces it
+        step = series.period * MINUTE
+        if len(series):
+            first, last = int(series.ctm[0]), int(series.ctm[-1]) + step
+            start = first if start is None else min(start, first)
+            end = last if end is None else max(end, last)
+        elif start is None or end is None:
+            return
+
+        path = self.path(series.symbol, series.period)
+        covered = self.coverage(series.symbol, series.period)
+        touches = covered is not None and start <= covered[1] and end >= covered[0]
+        if touches:
+            start, end = min(start, covered[0]), max(end, covered[1])
+        if not len(series):
+            # nothing to add, but the range is known to hold no more bars
+            if touches:
+                self.__cover(path, start, end)
+            return
+
+        records = np.empty(len(series), dtype=CANDLE_DTYPE)
+        for name, column in series.columns().items():
+            records[name] = column
+
+        existing = self.__records(series.symbol, series.period) if touches else None
+        if existing is not None:
+            last = existing["ctm"][-1]
+            if records["ctm"][0] > last:
+                with open(path, "ab") as file:
+                    file.write(records.tobytes())
+                self.__cover(path, start, end)
+                self.evict(keep=path)
+                return
+
+            # overlapping or older data: merge, letting the new bars win
+            merged = np.concatenate([records, np.asarray(existing)])
+            _, indexes = np.unique(merged["ctm"], return_index=True)
+            records = merged[indexes]
+            del existing
+        elif os.path.exists(path + COVERAGE_SUFFIX):
+            # replacing the block, whose coverage no longer applies
+            os.remove(path + COVERAGE_SUFFIX)
+
+        temporary = path + ".tmp"
+        records.tofile(temporary)
+        os.replace(temporary, path)
+        self.__cover(path, start, end)
+        self.evict(keep=path)
+
+    def __remove(self, path: str):
+        os.remove(path)
+        if os.path.exists(path + COVERAGE_SUFFIX):
+            os.remove(path + COVERAGE_SUFFIX)
+
+    def invalidate(self, symbol: str, period: Optional[int] = None):
+        prefix = f"{quote(symbol, safe='')}_"
+        for name in os.listdir(self.directory):
+            if not name.startswith(prefix) or not name.endswith(CACHE_SUFFIX):
+                continue
+            if period is not None and name != f"{prefix}{period}{CACHE_SUFFIX}":
+                continue
+            self.__remove(os.path.join(self.directory, name))
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(CACHE_SUFFIX):
+                self.__remove(os.path.join(self.directory, name))
+
+    def size(self) -> int:
+        return sum(size for _, _, size in self.__files())
+
+    def __files(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(CACHE_SUFFIX):
+                continue
+            stat = os.stat(os.path.join(self.directory, name))
+            files.append((stat.st_mtime, name, stat.st_size))
+        return sorted(files)
+
+    def evict(self, keep: Optional[str] = None):
+        # keep is a file just stored, which stays even if it alone is over
+        # max_bytes, so the data that was fetched can still be loaded
+        if not self.max_bytes and not self.max_age:
+            return
+
+        files = self.__files()
+        total = sum(size for _, _, size in files)
+        now = time.time()
+        for modified, name, size in files:
+            expired = self.max_age and now - modified > self.max_age
+            oversized = self.max_bytes and total > self.max_bytes
+            if not expired and not oversized:
+                continue
+            path = os.path.join(self.directory, name)
+            if path == keep:
+                continue
+            self.__remove(path)
+            total -= size
@@ -0,0 +1,302 @@
+import math
+from typing import Iterable, List, Optional
+import numpy as np
+
+from commands.request import Candle
+
+MINUTE = 60 * 1000
+
+PRICE_COLUMNS = ("open", "high", "low", "close", "vol")
+COLUMNS = ("ctm",) + PRICE_COLUMNS
+
+
+def ema_into(values: np.ndarray, out: np.ndarray, start: int, alpha: float):
+    # out[i] = alpha * values[i] + (1 - alpha) * out[i - 1], evaluated in
+    # blocks short enough that the decay powers stay well inside float64
+    n = len(values)
+    if start >= n:
+        return
+    if start == 0:
+        out[0] = values[0]
+        start = 1
+        if n == 1:
+            return
+
+    decay = 1 - alpha
+    if decay <= 0:
+        out[start:n] = values[start:n]
+        return
+    block = max(1, int(27 / -math.log(decay))) if decay < 1 else n
+    previous = out[start - 1]
+    for block_start in range(start, n, block):
+        chunk = values[block_start : block_start + block]
+        powers = decay ** np.arange(1, len(chunk) + 1)
+        result = powers * (previous + alpha * np.cumsum(chunk / powers))
+        out[block_start : block_start + len(chunk)] = result
+        previous = result[-1]
+
+
+class CandleSeries:
+    def __init__(
+        self,
+        symbol: str,
+        period: int = 1,
+        capacity: int = 1024,
+        max_length: Optional[int] = None,
+    ):
+        self.symbol = symbol
+        self.period = period
+        self.max_length = max_length
+        self.length = 0
+        self.buffers = {"ctm": np.empty(capacity, dtype=np.int64)}
+        for name in PRICE_COLUMNS:
+            self.buffers[name] = np.empty(capacity, dtype=np.float64)
+
+        # indicator key -> [number of bars computed, output buffer]
+        self.indicators: dict[tuple, list] = {}
+
+    @classmethod
+    def from_columns(cls, symbol: str, period: int, **columns) -> "CandleSeries":
+        series = cls(symbol, period, capacity=max(1, len(columns["ctm"])))
+        series.extend(**columns)
+        return series
+
+    @classmethod
+    def from_rate_infos(
+        cls, symbol: str, period: int, rate_infos: List[dict], digits: int
+    ) -> "CandleSeries":
+        series = cls(symbol, period, capacity=max(1, len(rate_infos)))
+        series.extend_rate_infos(rate_infos, digits)
+        return series
+
+    @property
+    def ctm(self) -> np.ndarray:
+        return self.buffers["ctm"][: self.length]
+
+    @property
+    def open(self) -> np.ndarray:
+        return self.buffers["open"][: self.length]
+
+    @property
+    def high(self) -> np.ndarray:
+        return self.buffers["high"][: self.length]
+
+    @property
+    def low(self) -> np.ndarray:
+        return self.buffers["low"][: self.length]
+
+    @property
+    def close(self) -> np.ndarray:
+        return self.buffers["close"][: self.length]
+
+    @property
+    def vol(self) -> np.ndarray:
+        return self.buffers["vol"][: self.length]
+
+    def columns(self) -> dict:
+        return {name: buffer[: self.length] for name, buffer in self.buffers.items()}
+
+    def __len__(self):
+        return self.length
+
+    def __reserve(self, extra: int):
+        needed = self.length + extra
+        if self.max_length and needed > self.max_length:
+            # drop the oldest bars so the series stays bounded
+            drop = min(self.length, needed - self.max_length)
+            for buffer in self.buffers.values():
+                buffer[: self.length - drop] = buffer[drop : self.length]
+            self.length -= drop
+            self.indicators.clear()
+            needed -= drop
+
+        capacity = len(self.buffers["ctm"])
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2)
+        if self.max_length:
+            capacity = min(capacity, max(needed, self.max_length))
+        for name, buffer in self.buffers.items():
+            grown = np.empty(capacity, dtype=buffer.dtype)
+            grown[: self.length] = buffer[: self.length]
+            self.buffers[name] = grown
+
+    def __invalidate(self, index: int):
+        for state in self.indicators.values():
+            state[0] = min(state[0], index)
+
+    def append(self, ctm: int, open, high, low, close, vol):
+        if self.length and ctm <= self.buffers["ctm"][self.length - 1]:
+            if ctm != self.buffers["ctm"][self.length - 1]:
+                raise Exception("Candles must be appended in time order")
+            # an update of the bar that is still forming
+            index = self.length - 1
+            self.__invalidate(index)
+        else:
+            self.__reserve(1)
+            index = self.length
+            self.length += 1
+
+        buffers = self.buffers
+        buffers["ctm"][index] = ctm
+        buffers["open"][index] = open
+        buffers["high"][index] = high
+        buffers["low"][index] = low
+        buffers["close"][index] = close
+        buffers["vol"][index] = vol or 0
+
+    def append_candle(self, candle: Candle):
+        self.append(
+            candle.ctm, candle.open, candle.high, candle.low, candle.close, candle.vol
+        )
+
+    def extend(self, ctm, open, high, low, close, vol):
+        ctm = np.asarray(ctm, dtype=np.int64)
+        if not len(ctm):
+            return
+        if self.length:
+            # keep only bars newer than what is already stored
+            keep = ctm > self.buffers["ctm"][self.length - 1]
+            if not keep.all():
+                ctm = ctm[keep]
+                open, high, low, close, vol = (
+                    np.asarray(column)[keep] for column in (open, high, low, close, vol)
+                )
+                if not len(ctm):
+                    return
+
+        self.__reserve(len(ctm))
+        start, end = self.length, self.length + len(ctm)
+        self.buffers["ctm"][start:end] = ctm
+        for name, column in zip(PRICE_COLUMNS, (open, high, low, close, vol)):
+            self.buffers[name][start:end] = column
+        self.length = end
+
+    def extend_rate_infos(self, rate_infos: List[dict], digits: int):
+        count = len(rate_infos)
+        scale = 10.0**digits
+        fields = ("ctm", "open", "high", "low", "close", "vol")
+        raw = {
+            field: np.fromiter(
+                (info[field] for info in rate_infos), dtype=np.float64, count=count
+            )
+            for field in fields
+        }
+        # prices other than open are sent as offsets from the open price
+        open = raw["open"]
+        self.extend(
+            raw["ctm"].astype(np.int64),
+            open / scale,
+            (open + raw["high"]) / scale,
+            (open + raw["low"]) / scale,
+            (open + raw["close"]) / scale,
+            raw["vol"],
+        )
+
+    def extend_candles(self, candles: Iterable[Candle]):
+        for candle in candles:
+            self.append_candle(candle)
+
+    def candle(self, index: int) -> Candle:
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError(index)
+        buffers = self.buffers
+        return Candle(
+            symbol=self.symbol,
+            ctm=int(buffers["ctm"][index]),
+            open=float(buffers["open"][index]),
+            high=float(buffers["high"][index]),
+            low=float(buffers["low"][index]),
+            close=float(buffers["close"][index]),
+            vol=float(buffers["vol"][index]),
+        )
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            columns = {name: column[index] for name, column in self.columns().items()}
+            return CandleSeries.from_columns(self.symbol, self.period, **columns)
+        return self.candle(index)
+
+    def __iter__(self):
+        for index in range(self.length):
+            yield self.candle(index)
+
+    def between(self, start: Optional[int] = None, end: Optional[int] = None):
+        ctm = self.ctm
+        first = 0 if start is None else int(np.searchsorted(ctm, start, "left"))
+        last = self.length if end is None else int(np.searchsorted(ctm, end, "left"))
+        return self[first:last]
+
+    def resample(self, period: int) -> "CandleSeries":
+        if period % self.period:
+            raise Exception("Period must be a multiple of the series period")
+        if not self.length:
+            return CandleSeries(self.symbol, period)
+
+        buckets = self.ctm // (period * MINUTE) * (period * MINUTE)
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        ends = np.r_[starts[1:], self.length] - 1
+        return CandleSeries.from_columns(
+            self.symbol,
+            period,
+            ctm=buckets[starts],
+            open=self.open[starts],
+            high=np.maximum.reduceat(self.high, starts),
+            low=np.minimum.reduceat(self.low, starts),
+            close=self.close[ends],
+            vol=np.add.reduceat(self.vol, starts),
+        )
+
+    def __indicator(self, key: tuple) -> tuple:
+        state = self.indicators.get(key)
+        if state is None:
+            state = self.indicators[key] = [0, np.empty(0)]
+        if len(state[1]) < self.length:
+            grown = np.empty(len(self.buffers["ctm"]))
+            grown[: state[0]] = state[1][: state[0]]
+            state[1] = grown
+        return state
+
+    def sma(self, window: int) -> np.ndarray:
+        state = self.__indicator(("sma", window))
+        start, out = state
+        if start < self.length:
+            begin = max(0, start - window + 1)
+            sums = np.cumsum(np.r_[0.0, self.close[begin:]])
+            for index in range(start, min(self.length, window - 1)):
+                out[index] = np.nan
+            first = max(start, window - 1)
+            indexes = np.arange(first, self.length) - begin + 1
+            out[first : self.length] = (sums[indexes] - sums[indexes - window]) / window
+            state[0] = self.length
+        return out[: self.length]
+
+    def ema(self, span: int) -> np.ndarray:
+        state = self.__indicator(("ema", span))
+        ema_into(self.close, state[1], state[0], 2 / (span + 1))
+        state[0] = self.length
+        return state[1][: self.length]
+
+    def true_range(self, start: int = 0) -> np.ndarray:
+        high, low = self.high[start:], self.low[start:]
+        close = self.close
+        previous = close[max(0, start - 1) : self.length - 1]
+        if not start:
+            previous = np.r_[close[:1], previous]
+        return np.maximum(high, previous) - np.minimum(low, previous)
+
+    def atr(self, window: int) -> np.ndarray:
+        # Wilder's smoothing of the true range
+        state = self.__indicator(("atr", window))
+        start = state[0]
+        if start < self.length:
+            ranges = np.empty(self.length)
+            ranges[start:] = self.true_range(start)
+            ema_into(ranges, state[1], start, 1 / window)
+            state[0] = self.length
+        return state[1][: self.length]
+
+    def __repr__(self):
+        return f"CandleSeries(symbol={self.symbol!r}, period={self.period}, length={self.length})"
@@ -0,0 +1,88 @@
+import json
+
+# every codec decodes to plain dicts and lists; records are then built by
+# their generated from_wire, a run of dict lookups without **kwargs. Typed
+# decoding would need a msgspec Struct twin of each record, which orjson and
+# json could not use and which would bypass wire_names and converters
+
+
+class JsonCodec:
+    name = "json"
+
+    def __init__(self):
+        self.decoder = json.JSONDecoder()
+        self.encoder = json.JSONEncoder(separators=(",", ":"))
+
+    def loads(self, data):
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data).decode()
+        return self.decoder.decode(data)
+
+    def dumps(self, obj) -> str:
+        return self.encoder.encode(obj)
+
+
+class OrjsonCodec:
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+
+        self.loads = orjson.loads
+        self.orjson_dumps = orjson.dumps
+
+    def dumps(self, obj) -> str:
+        # the server expects text frames, so hand websockets a str
+        return self.orjson_dumps(obj).decode()
+
+
+class MsgspecCodec:
+    name = "msgspec"
+
+    def __init__(self):
+        import msgspec
+
+        self.loads = msgspec.json.Decoder().decode
+        self.encode = msgspec.json.Encoder().encode
+
+    def dumps(self, obj) -> str:
+        return self.encode(obj).decode()
+
+
+CODECS = {
+    "orjson": OrjsonCodec,
+    "msgspec": MsgspecCodec,
+    "json": JsonCodec,
+}
+
+
+def get_codec(name: str):
+    if name not in CODECS:
+        raise Exception(f"Unknown codec: {name}")
+    return CODECS[name]()
+
+
+def best_codec():
+    for codec_class in CODECS.values():
+        try:
+            return codec_class()
+        except ImportError:
+            continue
+
+
+active = best_codec()
+loads = active.loads
+dumps = active.dumps
+
+
+def use(codec):
+    # a process-wide setting: callers look up codec.loads/codec.dumps at call
+    # time, so rebinding the module attributes switches the encoder and
+    # decoder of every XTB client and mock server at once. Call it once at
+    # startup, before any connection is opened
+    global active, loads, dumps
+    if isinstance(codec, str):
+        codec = get_codec(codec)
+    active = codec
+    loads = codec.loads
+    dumps = codec.dumps
@@ -1,15 +1,18 @@
-import json
+from typing import Optional
+
+import codec
 
 invalid_command = "INVALID COMMAND HELLO?"
 
 class BaseCommand:
     command: str = invalid_command
     result_class = None
+    trade: bool = False
 
     def __init__(self, **kwargs):
         self.arguments = kwargs
 
-    def serialize(self) -> str:
+    def serialize(self, custom_tag: Optional[str] = None) -> str:
         if self.command == invalid_command:
             raise Exception("Invalid command")
         serialized_arguments = {}
@@ -17,16 +20,34 @@ class BaseCommand:
             serialized_arguments[key] = (
                 value.serialize() if hasattr(value, "serialize") else value
             )
-        return json.dumps({"command": self.command, "arguments": serialized_arguments})
+        message = {"command": self.command, "arguments": serialized_arguments}
+        if custom_tag is not None:
+            message["customTag"] = custom_tag
+        return codec.dumps(message)
 
 class StreamingCommand(BaseCommand):
+    # commands without arguments serialize to the same text for a session
+    serialized_cache: dict = {}
+
     def serialize(self, stream_session_id: str) -> str:
         if not stream_session_id:
             raise Exception("No stream session id")
         if self.command == invalid_command:
             raise Exception("Invalid command")
 
-        return json.dumps(
+        if self.arguments:
+            return self.__serialize(stream_session_id)
+
+        key = (self.command, stream_session_id)
+        serialized = self.serialized_cache.get(key)
+        if serialized is None:
+            serialized = self.serialized_cache[key] = self.__serialize(
+                stream_session_id
+            )
+        return serialized
+
+    def __serialize(self, stream_session_id: str) -> str:
+        return codec.dumps(
             {
                 "command": self.command,
                 "streamSessionId": stream_session_id,
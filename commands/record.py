@@ -0,0 +1,67 @@
+class Record:
+    __slots__ = ()
+
+    # attribute -> wire key, or a tuple of keys tried in order, for fields
+    # whose name differs from the one the server sends
+    wire_names: dict = {}
+    # attribute -> function applied to the wire value
+    converters: dict = {}
+
+    fields: tuple = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.fields = tuple(
+            field
+            for klass in reversed(cls.__mro__)
+            for field in klass.__dict__.get("__slots__", ())
+        )
+
+        # constructors, equality and repr are generated once per class so
+        # decoding a message is a straight run of dict lookups
+        namespace = {"new": object.__new__, "converters": cls.converters}
+        lines = []
+        for field in cls.fields:
+            keys = cls.wire_names.get(field, field)
+            if isinstance(keys, str):
+                keys = (keys,)
+            value = " or ".join(f"get({key!r})" for key in keys)
+            if field in cls.converters:
+                value = f"converters[{field!r}]({value})"
+            lines.append(f"    self.{field} = {value}")
+        body = "\n".join(lines) or "    pass"
+        values = "".join(f"self.{field}, " for field in cls.fields)
+        fields = ", ".join(f"{field}={{self.{field}!r}}" for field in cls.fields)
+
+        exec(
+            f"def from_wire(cls, data):\n"
+            f"    self = new(cls)\n"
+            f"    get = data.get\n"
+            f"{body}\n"
+            f"    return self\n"
+            f"def __init__(self, **data):\n"
+            f"    get = data.get\n"
+            f"{body}\n"
+            f"def values(self):\n"
+            f"    return ({values})\n"
+            f"def __eq__(self, other):\n"
+            f"    if type(other) is not type(self):\n"
+            f"        return NotImplemented\n"
+            f"    return self.values() == other.values()\n"
+            f"def __repr__(self):\n"
+            f"    return f'{cls.__name__}({fields})'\n",
+            namespace,
+        )
+
+        cls.from_wire = classmethod(namespace["from_wire"])
+        for name in ("__init__", "values", "__eq__", "__repr__"):
+            if name not in cls.__dict__:
+                setattr(cls, name, namespace[name])
+        cls.__hash__ = None
+
+    def __getstate__(self):
+        return self.values()
+
+    def __setstate__(self, state):
+        for field, value in zip(self.fields, state):
+            setattr(self, field, value)
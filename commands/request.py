@@ -1,11 +1,13 @@
 from enum import Enum
 from typing import Optional
 from .base_commands import BaseCommand
+from .record import Record
 
 
 def ArrayOf(cls):
     def wrapper(_, items):
-        return [cls(**item) for item in items]
+        from_wire = cls.from_wire
+        return [from_wire(item) for item in items]
 
     return wrapper
 
@@ -17,40 +19,26 @@ class LoginCommand(BaseCommand):
         self.arguments = {"userId": userId, "password": password, **kwargs}
 
 
-class TradeTransactionResult:
-    def __init__(self, **kwargs):
-        self.order = kwargs.get("order")
+class PingCommand(BaseCommand):
+    command = "ping"
+
+
+class TradeTransactionResult(Record):
+    __slots__ = ("order",)
 
 
 class TradeTransactionCommand(BaseCommand):
     command = "tradeTransaction"
     result_class = TradeTransactionResult
+    trade = True
 
 
-class BalanceRecord:
-    def __init__(self, **kwargs):
-        self.currency = kwargs.get("currency")
-        self.balance = kwargs.get("balance")
-        self.equity = kwargs.get("equity")
-        self.margin = kwargs.get("margin")
-        self.freeMargin = kwargs.get("marginFree")
-        if not self.freeMargin:
-            self.freeMargin = kwargs.get("margin_free")
-        self.marginLevel = kwargs.get("marginLevel")
-        if not self.marginLevel:
-            self.marginLevel = kwargs.get("margin_level")
-
-    def __repr__(self):
-        return f"BalanceRecord(currency={self.currency}, balance={self.balance}, equity={self.equity}, margin={self.margin}, freeMargin={self.freeMargin}, marginLevel={self.marginLevel})"
-
-
-class StreamingBalanceRecord:
-    def __init__(self, **kwargs):
-        self.balance = kwargs.get("balance")
-        self.equity = kwargs.get("equity")
-        self.margin = kwargs.get("margin")
-        self.freeMargin = kwargs.get("marginFree")
-        self.marginLevel = kwargs.get("marginLevel")
+class BalanceRecord(Record):
+    __slots__ = ("currency", "balance", "equity", "margin", "freeMargin", "marginLevel")
+    wire_names = {
+        "freeMargin": ("marginFree", "margin_free"),
+        "marginLevel": ("marginLevel", "margin_level"),
+    }
 
 
 class GetMarginLevelCommand(BaseCommand):
@@ -58,10 +46,8 @@ class GetMarginLevelCommand(BaseCommand):
     result_class = BalanceRecord
 
 
-class ServerTime:
-    def __init__(self, **kwargs):
-        self.time = kwargs.get("time")
-        self.timeString = kwargs.get("timeString")
+class ServerTime(Record):
+    __slots__ = ("time", "timeString")
 
 
 class GetServerTimeCommand(BaseCommand):
@@ -79,6 +65,24 @@ class GetChartLastRequestCommand(BaseCommand):
         }
 
 
+class GetChartRangeRequestCommand(BaseCommand):
+    command = "getChartRangeRequest"
+
+    def __init__(
+        self, symbol: str, period: int, start: int, end: int, ticks: int = 0, **kwargs
+    ):
+        self.arguments = {
+            "info": {
+                "symbol": symbol,
+                "period": period,
+                "start": start,
+                "end": end,
+                "ticks": ticks,
+            },
+            **kwargs,
+        }
+
+
 class OperationType(Enum):
     BUY = 0
     SELL = 1
@@ -141,35 +145,47 @@ class TradeTransInfo:
         }
 
 
-class Candle:
-    def __init__(self, **kwargs):
-        self.symbol = kwargs.get("symbol")
-        self.ctm = kwargs.get("ctm")
-        self.ctmString = kwargs.get("ctmString")
-        self.open = kwargs.get("open")
-        self.high = kwargs.get("high")
-        self.low = kwargs.get("low")
-        self.close = kwargs.get("close")
-        self.vol = kwargs.get("vol")
-
-
-class CandleRequestResult:
-    def __init__(self, **kwargs):
-        self.digits = kwargs.get("digits")
-        self.candles = [Candle(**candle) for candle in kwargs.get("rateInfos")]
-
-
-class TradeRecord:
-    def __init__(self, **kwargs):
-        self.order = kwargs.get("order")
-        self.symbol = kwargs.get("symbol")
-        self.volume = kwargs.get("volume")
-        self.operation = kwargs.get("cmd")
-        self.position = kwargs.get("position")
-        self.close_price = kwargs.get("close_price")
-
-    def __repr__(self):
-        return f"TradeRecord(order={self.order}, symbol={self.symbol}, volume={self.volume}, operation={self.operation}, position={self.position})"
+class Candle(Record):
+    __slots__ = ("symbol", "ctm", "ctmString", "open", "high", "low", "close", "vol")
+
+
+def rate_info_to_candle(rate_info: dict, symbol: str, digits: int) -> dict:
+    # chart requests return the open price scaled by 10^digits and the other
+    # prices as offsets from it, unlike streamed candles
+    scale = 10**digits
+    open = rate_info["open"]
+    return {
+        "symbol": symbol,
+        "ctm": rate_info["ctm"],
+        "ctmString": rate_info.get("ctmString"),
+        "open": open / scale,
+        "high": (open + rate_info["high"]) / scale,
+        "low": (open + rate_info["low"]) / scale,
+        "close": (open + rate_info["close"]) / scale,
+        "vol": rate_info.get("vol"),
+    }
+
+
+class CandleRequestResult(Record):
+    __slots__ = ("digits", "candles")
+    wire_names = {"candles": "rateInfos"}
+    converters = {"candles": lambda items: [Candle.from_wire(c) for c in items]}
+
+
+class TradeRecord(Record):
+    __slots__ = (
+        "order",
+        "order2",
+        "symbol",
+        "volume",
+        "operation",
+        "position",
+        "open_price",
+        "close_price",
+        "profit",
+        "closed",
+    )
+    wire_names = {"operation": "cmd"}
 
 
 class GetTradesCommand(BaseCommand):
@@ -180,12 +196,8 @@ class GetTradesCommand(BaseCommand):
         self.arguments = {"openedOnly": opened_only, **kwargs}
 
 
-class MarginTradeRecord:
-    def __init__(self, **kwargs):
-        self.margin = kwargs.get("margin")
-
-    def __repr__(self):
-        return f"MarginTradeRecord(margin={self.margin})"
+class MarginTradeRecord(Record):
+    __slots__ = ("margin",)
 
 
 class GetMarginTradeCommand(BaseCommand):
@@ -196,20 +208,28 @@ class GetMarginTradeCommand(BaseCommand):
         self.arguments = {"symbol": symbol, "volume": volume, **kwargs}
 
 
-class SymbolRecord:
-    def __init__(self, **kwargs):
-        self.symbol = kwargs.get("symbol")
-        self.ask = kwargs.get("ask")
-        self.bid = kwargs.get("bid")
-        self.contractSize = kwargs.get("contractSize")
-        self.currency = kwargs.get("currency")
-        self.leverage = kwargs.get("leverage") * 0.01  # percentage
-        self.lot_min = kwargs.get("lotMin")
-        self.lot_max = kwargs.get("lotMax")
-        self.lot_step = kwargs.get("lotStep")
+class MarginMode(Enum):
+    FOREX = 101
+    CFD_LEVERAGED = 102
+    CFD = 103
+
 
-    def __repr__(self):
-        return f"SymbolRecord(symbol={self.symbol}, ask={self.ask}, bid={self.bid}, contractSize={self.contractSize}, currency={self.currency}, leverage={self.leverage}, lot_min={self.lot_min}, lot_max={self.lot_max}, lot_step={self.lot_step})"
+class SymbolRecord(Record):
+    __slots__ = (
+        "symbol",
+        "ask",
+        "bid",
+        "contractSize",
+        "currency",
+        "currencyProfit",
+        "leverage",
+        "marginMode",
+        "lot_min",
+        "lot_max",
+        "lot_step",
+    )
+    wire_names = {"lot_min": "lotMin", "lot_max": "lotMax", "lot_step": "lotStep"}
+    converters = {"leverage": lambda leverage: leverage * 0.01}  # percentage
 
 
 class GetSymbolCommand(BaseCommand):
@@ -218,3 +238,8 @@ class GetSymbolCommand(BaseCommand):
 
     def __init__(self, symbol: str, **kwargs):
         self.arguments = {"symbol": symbol, **kwargs}
+
+
+class GetAllSymbolsCommand(BaseCommand):
+    command = "getAllSymbols"
+    result_class = ArrayOf(SymbolRecord)
@@ -1,4 +1,6 @@
 from .base_commands import StreamingCommand
+from .record import Record
+from .request import Candle
 
 
 class getBalanceStreamCommand(StreamingCommand):
@@ -20,35 +22,81 @@ class getCandlesStreamCommand(StreamingCommand):
         self.arguments = {"symbol": symbol, **kwargs}
 
 
-class StreamingProfitRecord:
-    def __init__(self, **kwargs):
-        self.order = kwargs.get("order")
-        self.order2 = kwargs.get("order2")
-        self.position = kwargs.get("position")
-        self.profit = kwargs.get("profit")
-
-
-class StreamingTradeRecord:
-    def __init__(self, **kwargs):
-        self.symbol: str = kwargs.get("symbol")
-        self.volume = kwargs.get("volume")
-        self.openPrice = kwargs.get("openPrice")
-        self.closePrice = kwargs.get("closePrice")
-        self.profit = kwargs.get("profit")
-        self.openTime = kwargs.get("openTime")
-        self.closeTime = kwargs.get("closeTime")
-        self.comment = kwargs.get("comment")
-        self.commission = kwargs.get("commission")
-        self.swaps = kwargs.get("swaps")
-        self.order = kwargs.get("order")
-        self.order2 = kwargs.get("order2")
-        self.position: int = kwargs.get("position")
-        self.type = kwargs.get("type")
-        self.operation = kwargs.get("cmd")
-        self.offset = kwargs.get("offset")
-        self.expiration = kwargs.get("expiration")
-        self.tp = kwargs.get("tp")
-        self.sl = kwargs.get("sl")
+class getTickPricesStreamCommand(StreamingCommand):
+    command = "getTickPrices"
+
+    def __init__(self, symbol, minArrivalTime: int = 0, maxLevel: int = 0, **kwargs):
+        self.arguments = {
+            "symbol": symbol,
+            "minArrivalTime": minArrivalTime,
+            "maxLevel": maxLevel,
+            **kwargs,
+        }
+
+
+class getKeepAliveStreamCommand(StreamingCommand):
+    command = "getKeepAlive"
+
+
+class pingStreamCommand(StreamingCommand):
+    command = "ping"
+
+
+class stopBalanceStreamCommand(StreamingCommand):
+    command = "stopBalance"
+
+
+class stopTradesStreamCommand(StreamingCommand):
+    command = "stopTrades"
+
+
+class stopProfitStreamCommand(StreamingCommand):
+    command = "stopProfits"
+
+
+class stopCandlesStreamCommand(StreamingCommand):
+    command = "stopCandles"
+
+    def __init__(self, symbol, **kwargs):
+        self.arguments = {"symbol": symbol, **kwargs}
+
+
+class stopTickPricesStreamCommand(StreamingCommand):
+    command = "stopTickPrices"
+
+    def __init__(self, symbol, **kwargs):
+        self.arguments = {"symbol": symbol, **kwargs}
+
+
+class StreamingProfitRecord(Record):
+    __slots__ = ("order", "order2", "position", "profit")
+
+
+class StreamingTradeRecord(Record):
+    __slots__ = (
+        "symbol",
+        "volume",
+        "openPrice",
+        "closePrice",
+        "profit",
+        "openTime",
+        "closeTime",
+        "comment",
+        "commission",
+        "swaps",
+        "order",
+        "order2",
+        "position",
+        "type",
+        "operation",
+        "offset",
+        "expiration",
+        "tp",
+        "sl",
+        "closed",
+        "state",
+    )
+    wire_names = {"operation": "cmd"}
 
     def __str__(self):
         return (
@@ -72,3 +120,39 @@ class StreamingTradeRecord:
             f"tp={self.tp},\n"
             f"sl={self.sl})"
         )
+
+
+class StreamingBalanceRecord(Record):
+    __slots__ = ("balance", "equity", "margin", "freeMargin", "marginLevel")
+    wire_names = {"freeMargin": "marginFree"}
+
+
+class StreamingKeepAliveRecord(Record):
+    __slots__ = ("timestamp",)
+
+
+class StreamingTickRecord(Record):
+    __slots__ = (
+        "symbol",
+        "ask",
+        "bid",
+        "askVolume",
+        "bidVolume",
+        "high",
+        "low",
+        "level",
+        "quoteId",
+        "spreadRaw",
+        "spreadTable",
+        "timestamp",
+    )
+
+
+streaming_record_classes = {
+    "trade": StreamingTradeRecord,
+    "balance": StreamingBalanceRecord,
+    "profit": StreamingProfitRecord,
+    "candle": Candle,
+    "tickPrices": StreamingTickRecord,
+    "keepAlive": StreamingKeepAliveRecord,
+}
@@ -0,0 +1,85 @@
+import asyncio
+from typing import Callable, List, Optional, Tuple
+
+
+class LatestValues:
+    def __init__(self, key: Callable):
+        self.key = key
+        self.values: dict = {}
+        self.versions: dict = {}
+        self.version = 0
+        self.updates = 0
+
+        self.waiter: Optional[asyncio.Future] = None
+        self.notifiers: List[asyncio.Task] = []
+
+    def update(self, record):
+        key = self.key(record)
+        self.version += 1
+        self.updates += 1
+        self.values[key] = record
+        self.versions[key] = self.version
+
+        if self.waiter and not self.waiter.done():
+            self.waiter.set_result(None)
+        self.waiter = None
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+    def __contains__(self, key) -> bool:
+        return key in self.values
+
+    def __len__(self):
+        return len(self.values)
+
+    def remove(self, key):
+        self.values.pop(key, None)
+        self.versions.pop(key, None)
+
+    def snapshot(self) -> dict:
+        return dict(self.values)
+
+    def changed_since(self, version: int) -> Tuple[int, dict]:
+        if version >= self.version:
+            return self.version, {}
+        return self.version, {
+            key: self.values[key]
+            for key, changed_at in self.versions.items()
+            if changed_at > version
+        }
+
+    async def wait_changed(
+        self, version: int, timeout: Optional[float] = None
+    ) -> Tuple[int, dict]:
+        while self.version <= version:
+            if not self.waiter:
+                self.waiter = asyncio.get_event_loop().create_future()
+            await asyncio.wait_for(asyncio.shield(self.waiter), timeout)
+        return self.changed_since(version)
+
+    def subscribe(self, callback: Callable, interval: float = 0) -> asyncio.Task:
+        # bursts are coalesced: the callback gets every key that changed since
+        # its previous call, at most once per interval
+        async def notify():
+            version = self.version
+            while True:
+                version, changes = await self.wait_changed(version)
+                try:
+                    await callback(changes)
+                except Exception as e:
+                    print(f"Conflated callback failed: {e!r}")
+                if interval:
+                    await asyncio.sleep(interval)
+
+        task = asyncio.create_task(notify())
+        self.notifiers.append(task)
+        return task
+
+    def close(self):
+        for task in self.notifiers:
+            task.cancel()
+        self.notifiers = []
@@ -0,0 +1,164 @@
+import asyncio
+import itertools
+import time
+from typing import Optional, Tuple
+import websockets
+from websockets.client import WebSocketClientProtocol
+
+import codec
+from commands.base_commands import BaseCommand
+from commands.request import LoginCommand, PingCommand
+from metrics import Metrics
+from rate_limit import TokenBucket
+from recording import COMMAND, RESPONSE, SessionRecorder
+
+
+class RequestConnection:
+    def __init__(
+        self,
+        url: str,
+        request_rate: float = 5,
+        request_burst: int = 5,
+        trade_rate: float = 5,
+        trade_burst: int = 5,
+        metrics: Optional[Metrics] = None,
+    ):
+        self.url = url
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.recorder: Optional[SessionRecorder] = None
+        self.websocket: Optional[WebSocketClientProtocol] = None
+        self.stream_session_id: Optional[str] = None
+        self.reader_task: Optional[asyncio.Task] = None
+
+        self.command_tags = itertools.count(1)
+        self.command_futures: dict[str, asyncio.Future] = {}
+        self.outstanding = 0
+
+        self.request_limiter = TokenBucket(request_rate, request_burst)
+        self.trade_limiter = TokenBucket(trade_rate, trade_burst)
+
+    @property
+    def closed(self) -> bool:
+        return not self.websocket or self.websocket.closed
+
+    async def login(self, userId: str, password: str):
+        if self.websocket:
+            raise Exception("Already logged in")
+
+        self.websocket = await websockets.connect(self.url)
+
+        login_command = LoginCommand(userId, password)
+        await self.websocket.send(login_command.serialize())
+
+        response = await self.websocket.recv()
+        response = codec.loads(response)
+
+        if not response["status"]:
+            await self.websocket.close()
+            raise Exception("Login failed")
+
+        self.stream_session_id = response["streamSessionId"]
+        self.reader_task = asyncio.create_task(self.__handleResponses())
+
+    async def __handleResponses(self):
+        while True:
+            try:
+                message = await self.websocket.recv()
+            except websockets.exceptions.ConnectionClosed:
+                print("Connection closed")
+                break
+
+            if self.recorder is not None:
+                self.recorder.write(RESPONSE, message)
+            response = codec.loads(message)
+            future = self.command_futures.pop(response.get("customTag"), None)
+            if future and not future.done():
+                future.set_result(response)
+
+        for future in self.command_futures.values():
+            if not future.done():
+                future.set_exception(Exception("Connection closed"))
+        self.command_futures.clear()
+
+    async def send(self, command: BaseCommand, limited: bool = True, **kwargs) -> dict:
+        # unlimited commands skip the token buckets, for health checks that
+        # must not queue behind a backlog of requests
+        response, _, _ = await self.timed(command, limited, **kwargs)
+        return response
+
+    async def timed(
+        self, command: BaseCommand, limited: bool = True, **kwargs
+    ) -> Tuple[dict, float, float]:
+        # the response with the time.time() it was sent and received at,
+        # leaving out any wait for the rate limiters
+        if self.closed:
+            raise Exception("Connection closed")
+
+        self.outstanding += 1
+        try:
+            queued_at = time.perf_counter()
+            if limited and command.trade:
+                await self.trade_limiter.acquire()
+                self.metrics.observe(
+                    "xtb_rate_limit_wait_seconds",
+                    time.perf_counter() - queued_at,
+                    limiter="trade",
+                )
+            limited_at = time.perf_counter()
+            if limited:
+                await self.request_limiter.acquire()
+            sent_at = time.perf_counter()
+            if limited:
+                self.metrics.observe(
+                    "xtb_rate_limit_wait_seconds",
+                    sent_at - limited_at,
+                    limiter="request",
+                )
+
+            tag = str(next(self.command_tags))
+            cmd = command.serialize(**kwargs, custom_tag=tag)
+            if self.recorder is not None:
+                self.recorder.write(COMMAND, cmd)
+
+            future = asyncio.get_event_loop().create_future()
+            self.command_futures[tag] = future
+            try:
+                sent_time = time.time()
+                await self.websocket.send(cmd)
+                response = await future
+                received_time = time.time()
+                self.metrics.observe(
+                    "xtb_command_seconds",
+                    time.perf_counter() - sent_at,
+                    command=command.command,
+                )
+                return response, sent_time, received_time
+            finally:
+                self.command_futures.pop(tag, None)
+        finally:
+            self.outstanding -= 1
+
+    async def ping(self, timeout: float = 10) -> Optional[float]:
+        # the round trip in seconds, or None when the ping failed
+        try:
+            response, sent_at, received_at = await asyncio.wait_for(
+                self.timed(PingCommand(), limited=False), timeout
+            )
+        except Exception:
+            return None
+        if not response.get("status"):
+            return None
+        return received_at - sent_at
+
+    async def close(self):
+        if self.websocket:
+            await self.websocket.close()
+        if self.reader_task:
+            await self.reader_task
+
+    def stats(self) -> dict:
+        return {
+            "outstanding": self.outstanding,
+            "request": self.request_limiter.stats(),
+            "trade": self.trade_limiter.stats(),
+        }
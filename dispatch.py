@@ -0,0 +1,224 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Optional
+
+BLOCK = "block"
+DROP_OLDEST = "drop_oldest"
+CONFLATE = "conflate"
+
+POLICIES = (BLOCK, DROP_OLDEST, CONFLATE)
+
+
+class SubscriberQueue:
+    def __init__(
+        self, maxsize: int = 1000, policy: str = BLOCK, key: Optional[Callable] = None
+    ):
+        if policy not in POLICIES:
+            raise Exception(f"Unknown overflow policy: {policy}")
+        if policy == CONFLATE and key is None:
+            raise Exception("Conflating queues need a key function")
+
+        self.maxsize = maxsize
+        self.policy = policy
+        self.key = key
+
+        # (item, enqueue time); conflating queues keep one entry per key and
+        # preserve the time the oldest undelivered update arrived
+        self.items = OrderedDict() if policy == CONFLATE else deque()
+        self.not_empty = asyncio.Event()
+        self.not_full = asyncio.Event()
+        self.dropped = 0
+        self.closed = False
+
+    def __len__(self):
+        return len(self.items)
+
+    def close(self):
+        # wakes a publisher blocked on a full queue; later puts are discarded
+        self.closed = True
+        self.not_full.set()
+
+    async def put(self, item):
+        if self.closed:
+            return
+        now = time.monotonic()
+
+        if self.policy == CONFLATE:
+            key = self.key(item)
+            if key in self.items:
+                self.items[key] = (item, self.items[key][1])
+                self.dropped += 1
+            else:
+                self.items[key] = (item, now)
+
+        elif self.policy == DROP_OLDEST:
+            if len(self.items) >= self.maxsize:
+                self.items.popleft()
+                self.dropped += 1
+            self.items.append((item, now))
+
+        else:
+            while len(self.items) >= self.maxsize:
+                self.not_full.clear()
+                await self.not_full.wait()
+                if self.closed:
+                    return
+            self.items.append((item, time.monotonic()))
+
+        self.not_empty.set()
+
+    def __pop(self) -> tuple:
+        if self.policy == CONFLATE:
+            _, entry = self.items.popitem(last=False)
+        else:
+            entry = self.items.popleft()
+        self.not_full.set()
+        return entry
+
+    async def get(self) -> tuple:
+        while not self.items:
+            self.not_empty.clear()
+            await self.not_empty.wait()
+        return self.__pop()
+
+    async def get_batch(self, limit: int) -> list:
+        # waits for the first entry, then takes whatever else is queued
+        entries = [await self.get()]
+        while self.items and len(entries) < limit:
+            entries.append(self.__pop())
+        return entries
+
+
+class Subscriber:
+    # without a handler the subscriber is pulled from with get/get_batch
+    def __init__(
+        self,
+        name: str,
+        handler: Optional[Callable],
+        maxsize: int = 1000,
+        policy: str = BLOCK,
+        key: Optional[Callable] = None,
+    ):
+        self.name = name
+        self.handler = handler
+        self.queue = SubscriberQueue(maxsize, policy, key)
+        self.task: Optional[asyncio.Task] = None
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+        self.delivered = 0
+        self.errors = 0
+        self.lag = 0.0
+        self.max_lag = 0.0
+
+    def start(self):
+        if self.handler and not self.task:
+            self.task = asyncio.create_task(self.__run())
+
+    def stop(self):
+        self.queue.close()
+        self.idle.set()
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    async def put(self, item):
+        if self.queue.closed:
+            return
+        self.idle.clear()
+        await self.queue.put(item)
+
+    async def join(self):
+        await self.idle.wait()
+
+    def __received(self, entries: list):
+        self.lag = time.monotonic() - entries[0][1]
+        self.max_lag = max(self.max_lag, self.lag)
+
+    def __delivered(self, count: int):
+        self.delivered += count
+        if not self.queue:
+            self.idle.set()
+
+    async def get(self):
+        entries = [await self.queue.get()]
+        self.__received(entries)
+        self.__delivered(1)
+        return entries[0][0]
+
+    async def get_batch(self, limit: int) -> list:
+        entries = await self.queue.get_batch(limit)
+        self.__received(entries)
+        self.__delivered(len(entries))
+        return [item for item, _ in entries]
+
+    async def __run(self):
+        while True:
+            entry = await self.queue.get()
+            self.__received([entry])
+
+            try:
+                await self.handler(entry[0])
+            except Exception as e:
+                self.errors += 1
+                print(f"Subscriber {self.name} failed: {e!r}")
+            self.__delivered(1)
+
+    def stats(self) -> dict:
+        return {
+            "policy": self.queue.policy,
+            "depth": len(self.queue),
+            "delivered": self.delivered,
+            "dropped": self.queue.dropped,
+            "errors": self.errors,
+            "lag": self.lag,
+            "max_lag": self.max_lag,
+        }
+
+
+class Dispatcher:
+    def __init__(self):
+        # stream key -> subscribers, e.g. "trade" or ("candle", "EURUSD")
+        self.subscribers: dict = {}
+
+    def subscribe(self, stream_key, handler: Callable, **options) -> Subscriber:
+        name = stream_key if isinstance(stream_key, str) else ":".join(stream_key)
+        subscriber = Subscriber(name, handler, **options)
+        self.subscribers.setdefault(stream_key, []).append(subscriber)
+        subscriber.start()
+        return subscriber
+
+    def unsubscribe(self, stream_key, subscriber: Subscriber):
+        subscribers = self.subscribers.get(stream_key, [])
+        if subscriber in subscribers:
+            subscribers.remove(subscriber)
+            subscriber.stop()
+        if not subscribers:
+            self.subscribers.pop(stream_key, None)
+
+    def has_subscribers(self, stream_key) -> bool:
+        return bool(self.subscribers.get(stream_key))
+
+    async def publish(self, stream_key, item):
+        # a copy, as subscribers can be removed while a put is blocked
+        for subscriber in list(self.subscribers.get(stream_key, ())):
+            await subscriber.put(item)
+
+    async def join(self):
+        # until every subscriber has handled everything published so far
+        for subscribers in list(self.subscribers.values()):
+            for subscriber in list(subscribers):
+                await subscriber.join()
+
+    def stop(self):
+        for subscribers in self.subscribers.values():
+            for subscriber in subscribers:
+                subscriber.stop()
+
+    def stats(self) -> list:
+        return [
+            {"name": subscriber.name, **subscriber.stats()}
+            for subscribers in self.subscribers.values()
+            for subscriber in subscribers
+        ]
@@ -0,0 +1,174 @@
+import asyncio
+import math
+import time
+from collections import deque
+from typing import AsyncIterator, Iterable, List, Optional, Tuple
+
+from candle_cache import CandleCache
+from candles import MINUTE, CandleSeries
+from xtb_types import BatchResult
+
+
+class CandleDownloader:
+    def __init__(
+        self,
+        xtb,
+        concurrency: int = 4,
+        chunk_bars: int = 10_000,
+        retries: int = 3,
+        retry_delay: float = 1,
+    ):
+        self.xtb = xtb
+        # requests in flight across every download sharing this instance;
+        # pacing is still left to the connection rate limiters
+        self.concurrency = concurrency
+        self.requests = asyncio.Semaphore(concurrency)
+        self.chunk_bars = chunk_bars
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+        self.chunks_fetched = 0
+        self.bars_fetched = 0
+        self.retried = 0
+
+    def chunks(
+        self, period: int, start: int, end: Optional[int] = None
+    ) -> List[Tuple[int, int]]:
+        # [start, end) millisecond ranges of at most chunk_bars bars each
+        if end is None:
+            end = math.floor(time.time() * 1000)
+        span = self.chunk_bars * period * MINUTE
+        start = start // (period * MINUTE) * (period * MINUTE)
+        return [(s, min(s + span, end)) for s in range(start, end, span)]
+
+    async def __fetch(
+        self, symbol: str, period: int, start: int, end: int
+    ) -> CandleSeries:
+        attempt = 0
+        while True:
+            try:
+                async with self.requests:
+                    series = await self.xtb.fetchCandles(symbol, period, start, end)
+                break
+            except Exception as e:
+                if attempt >= self.retries:
+                    raise Exception(
+                        f"Download of {symbol} {start}-{end} failed: {e}"
+                    ) from e
+                self.retried += 1
+                await asyncio.sleep(self.retry_delay * 2**attempt)
+                attempt += 1
+
+        self.chunks_fetched += 1
+        self.bars_fetched += len(series)
+        # range requests include the end bar, which opens the next chunk
+        return series.between(start, end)
+
+    async def __download(
+        self,
+        symbol: str,
+        period: int,
+        start: int,
+        end: Optional[int] = None,
+        reverse: bool = False,
+    ) -> AsyncIterator[Tuple[Tuple[int, int], CandleSeries]]:
+        # (chunk, series) in time order, or newest first with reverse; at
+        # most concurrency chunks are fetched ahead, so memory does not grow
+        # with the length of the range
+        chunks = self.chunks(period, start, end)
+        if reverse:
+            chunks.reverse()
+        chunks = iter(chunks)
+        pending = deque()
+
+        def schedule():
+            chunk = next(chunks, None)
+            if chunk is not None:
+                task = asyncio.create_task(self.__fetch(symbol, period, *chunk))
+                pending.append((chunk, task))
+
+        try:
+            for _ in range(self.concurrency):
+                schedule()
+            while pending:
+                chunk, task = pending.popleft()
+                series = await task
+                schedule()
+                yield chunk, series
+        finally:
+            for _, task in pending:
+                task.cancel()
+
+    async def download(
+        self,
+        symbol: str,
+        period: int,
+        start: int,
+        end: Optional[int] = None,
+        reverse: bool = False,
+    ) -> AsyncIterator[CandleSeries]:
+        async for _, series in self.__download(symbol, period, start, end, reverse):
+            if len(series):
+                yield series
+
+    async def download_to_cache(
+        self,
+        cache: CandleCache,
+        symbol: str,
+        period: int,
+        start: int,
+        end: Optional[int] = None,
+    ) -> int:
+        # stores each chunk as it arrives, fetching only what the cache is
+        # missing. The cache holds one block without holes, so the head is
+        # fetched newest first and the tail oldest first, and every chunk
+        # touches what is already stored
+        bars = 0
+        covered = cache.coverage(symbol, period)
+        for missing_start, missing_end in cache.missing_ranges(
+            symbol, period, start, end
+        ):
+            head = covered is not None and missing_start < covered[0]
+            async for (chunk_start, chunk_end), series in self.__download(
+                symbol, period, missing_start, missing_end, reverse=head
+            ):
+                cache.store(series, chunk_start, chunk_end)
+                bars += len(series)
+        return bars
+
+    async def download_many(
+        self,
+        cache: CandleCache,
+        symbols: Iterable[str],
+        period: int,
+        start: int,
+        end: Optional[int] = None,
+    ) -> BatchResult:
+        # bars written per symbol; a failed symbol does not stop the others.
+        # Only concurrency symbols download at once, which bounds the chunks
+        # held waiting for their turn
+        symbols = list(dict.fromkeys(symbols))
+        running = asyncio.Semaphore(self.concurrency)
+
+        async def download(symbol: str) -> int:
+            async with running:
+                return await self.download_to_cache(cache, symbol, period, start, end)
+
+        results = await asyncio.gather(
+            *[download(symbol) for symbol in symbols], return_exceptions=True
+        )
+
+        batch = BatchResult()
+        for symbol, result in zip(symbols, results):
+            if isinstance(result, Exception):
+                batch.errors[symbol] = result
+            else:
+                batch[symbol] = result
+        return batch
+
+    def stats(self) -> dict:
+        return {
+            "chunks": self.chunks_fetched,
+            "bars": self.bars_fetched,
+            "retried": self.retried,
+        }
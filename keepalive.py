@@ -0,0 +1,98 @@
+import time
+from typing import List, Optional, Tuple
+
+RTT = "rtt"
+STALE = "stale"
+
+
+class LinkMonitor:
+    def __init__(
+        self,
+        rtt_threshold: Optional[float] = 1.0,
+        stale_threshold: Optional[float] = 30,
+        clock_sync_interval: float = 300,
+        alpha: float = 0.2,
+    ):
+        # warnings fire once when a threshold is crossed and again only after
+        # the link has recovered; None disables a check
+        self.rtt_threshold = rtt_threshold
+        self.stale_threshold = stale_threshold
+        self.clock_sync_interval = clock_sync_interval
+        self.alpha = alpha
+
+        self.rtt: Optional[float] = None
+        self.rtt_min: Optional[float] = None
+        self.rtt_last: Optional[float] = None
+        self.rtt_samples = 0
+
+        # server clock minus local clock, in seconds
+        self.clock_offset = 0.0
+        self.clock_rtt: Optional[float] = None
+        self.clock_synced_at: Optional[float] = None
+
+        self.last_stream_time: Optional[float] = None
+        self.warnings: set = set()
+
+    def record_rtt(self, rtt: float):
+        self.rtt_last = rtt
+        self.rtt_samples += 1
+        if self.rtt is None:
+            self.rtt = rtt
+        else:
+            self.rtt += self.alpha * (rtt - self.rtt)
+        self.rtt_min = rtt if self.rtt_min is None else min(self.rtt_min, rtt)
+
+    def record_clock(self, sent_at: float, server_time_ms: int, received_at: float):
+        # the server read its clock halfway through the round trip; a sample
+        # with a longer round trip than the last one is trusted less
+        rtt = received_at - sent_at
+        offset = server_time_ms / 1000 - (sent_at + received_at) / 2
+        if self.clock_rtt is None or rtt <= 2 * self.clock_rtt:
+            self.clock_offset = offset
+        else:
+            self.clock_offset += self.alpha * (offset - self.clock_offset)
+        self.clock_rtt = rtt
+        self.clock_synced_at = time.monotonic()
+
+    def clock_due(self) -> bool:
+        return (
+            self.clock_synced_at is None
+            or time.monotonic() - self.clock_synced_at >= self.clock_sync_interval
+        )
+
+    def stream_activity(self, now: Optional[float] = None):
+        self.last_stream_time = time.monotonic() if now is None else now
+
+    def staleness(self) -> Optional[float]:
+        if self.last_stream_time is None:
+            return None
+        return time.monotonic() - self.last_stream_time
+
+    def server_time(self, local: Optional[float] = None) -> int:
+        # a local time.time() value on the server clock, in milliseconds
+        local = time.time() if local is None else local
+        return int((local + self.clock_offset) * 1000)
+
+    def check(self) -> List[Tuple[str, float]]:
+        # newly raised warnings as (kind, value)
+        raised = []
+        for kind, value, threshold in (
+            (RTT, self.rtt, self.rtt_threshold),
+            (STALE, self.staleness(), self.stale_threshold),
+        ):
+            if threshold is None or value is None or value <= threshold:
+                self.warnings.discard(kind)
+            elif kind not in self.warnings:
+                self.warnings.add(kind)
+                raised.append((kind, value))
+        return raised
+
+    def stats(self) -> dict:
+        return {
+            "rtt": self.rtt,
+            "rtt_min": self.rtt_min,
+            "rtt_last": self.rtt_last,
+            "clock_offset": self.clock_offset,
+            "staleness": self.staleness(),
+            "warnings": sorted(self.warnings),
+        }
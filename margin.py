@@ -0,0 +1,203 @@
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from commands.request import MarginMode, SymbolRecord
+from positions import PositionBook
+from quotes import QuoteBook
+from symbol_cache import SymbolCache
+
+
+def directions(operations, shape) -> np.ndarray:
+    # buy-side operations are even, sell-side odd
+    if operations is None:
+        return np.ones(shape)
+    operations = np.asarray(
+        [getattr(op, "value", op) for op in np.ravel(operations)]
+    ).reshape(np.shape(operations))
+    return 1 - 2 * (operations % 2)
+
+
+class Basket:
+    # the fixed part of a set of symbols, so repeated sizings only read the
+    # latest prices and do array maths
+    def __init__(self, calculator: "MarginCalculator", specs: List[SymbolRecord]):
+        self.calculator = calculator
+        self.symbols = [spec.symbol for spec in specs]
+        self.contract_size = np.array([spec.contractSize for spec in specs], float)
+        self.margin_ratio = np.array([spec.leverage for spec in specs], float)
+        # forex margin is a share of the contract in the base currency, CFD
+        # margin a share of its value at the current price
+        self.priced = np.array(
+            [spec.marginMode != MarginMode.FOREX.value for spec in specs], bool
+        )
+        self.margin_currencies = [spec.currency for spec in specs]
+        self.profit_currencies = [
+            spec.currencyProfit or spec.currency for spec in specs
+        ]
+
+        self.rows = calculator.quotes.rows(self.symbols)
+        self.streamed = self.rows >= 0
+        # cached quotes stand in for symbols without a tick stream
+        self.spec_bid = np.array([spec.bid or np.nan for spec in specs], float)
+        self.spec_ask = np.array([spec.ask or np.nan for spec in specs], float)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def prices(self):
+        quotes = self.calculator.quotes
+        if len(quotes) and not self.streamed.all():
+            # symbols may have started streaming since the basket was built
+            self.rows = quotes.rows(self.symbols)
+            self.streamed = self.rows >= 0
+        bid = np.where(self.streamed, quotes.bid[self.rows], self.spec_bid)
+        ask = np.where(self.streamed, quotes.ask[self.rows], self.spec_ask)
+        return bid, ask
+
+    def __rates(self, currencies: List[str]) -> np.ndarray:
+        rates = {c: self.calculator.rate(c) for c in set(currencies)}
+        return np.array([rates[c] for c in currencies])
+
+    def margin(self, volumes, operations=None) -> np.ndarray:
+        # volumes is (legs,) or (sizings, legs); margin per leg in the
+        # account currency
+        volumes = np.asarray(volumes, float)
+        direction = directions(operations, volumes.shape)
+        bid, ask = self.prices()
+        price = np.where(self.priced, np.where(direction > 0, ask, bid), 1.0)
+        return (
+            volumes
+            * self.contract_size
+            * price
+            * self.margin_ratio
+            * self.__rates(self.margin_currencies)
+        )
+
+    def profit(self, volumes, open_prices, operations=None) -> np.ndarray:
+        # floating profit per leg in the account currency, closing buys at
+        # the bid and sells at the ask
+        volumes = np.asarray(volumes, float)
+        direction = directions(operations, volumes.shape)
+        bid, ask = self.prices()
+        close = np.where(direction > 0, bid, ask)
+        return (
+            direction
+            * (close - np.asarray(open_prices, float))
+            * volumes
+            * self.contract_size
+            * self.__rates(self.profit_currencies)
+        )
+
+
+class MarginCalculator:
+    def __init__(self, symbol_cache: SymbolCache, quotes: QuoteBook, currency: str):
+        self.symbol_cache = symbol_cache
+        self.quotes = quotes
+        # account currency
+        self.currency = currency
+
+        # specs loaded for this calculator, kept here so that eviction from
+        # the shared cache cannot take them away
+        self.specs: Dict[str, SymbolRecord] = {}
+        # symbol -> (local, server) margins that disagreed in the last check
+        self.drift: Dict[str, tuple] = {}
+
+    def __lookup(self, symbol: str) -> Optional[SymbolRecord]:
+        spec = self.specs.get(symbol)
+        if spec is None:
+            spec = self.symbol_cache.get(symbol)
+        return spec
+
+    def spec(self, symbol: str) -> SymbolRecord:
+        spec = self.__lookup(symbol)
+        if spec is None:
+            raise Exception(f"No cached spec for symbol: {symbol}")
+        return spec
+
+    def basket(self, symbols: Sequence[str]) -> Basket:
+        # keep the basket to evaluate many sizings of the same symbols
+        return Basket(self, [self.spec(symbol) for symbol in symbols])
+
+    def __mid(self, symbol: str) -> Optional[float]:
+        if symbol in self.quotes:
+            return self.quotes.mid(symbol)
+        spec = self.__lookup(symbol)
+        if spec is not None and spec.bid and spec.ask:
+            return (spec.bid + spec.ask) / 2
+        return None
+
+    def rate(self, currency: str) -> float:
+        # multiplier from currency to the account currency
+        if currency == self.currency:
+            return 1.0
+        price = self.__mid(currency + self.currency)
+        if price:
+            return price
+        price = self.__mid(self.currency + currency)
+        if price:
+            return 1 / price
+        raise Exception(f"No conversion rate from {currency} to {self.currency}")
+
+    def conversion_symbols(self, symbols: Iterable[str]) -> List[str]:
+        # the pairs needed to convert margin and profit for the given symbols
+        pairs = []
+        for symbol in symbols:
+            spec = self.spec(symbol)
+            for currency in (spec.currency, spec.currencyProfit):
+                if currency and currency != self.currency:
+                    pairs += [currency + self.currency, self.currency + currency]
+        return list(dict.fromkeys(pairs))
+
+    def margin(self, symbols: Sequence[str], volumes, operations=None) -> np.ndarray:
+        return self.basket(symbols).margin(volumes, operations)
+
+    def account(self, positions: PositionBook, balance: float) -> dict:
+        # margin, floating profit and margin level of the open book from local
+        # prices, without waiting for profit or balance pushes
+        trades = list(positions.values())
+        if not trades:
+            return {
+                "margin": 0.0,
+                "profit": 0.0,
+                "equity": balance,
+                "free_margin": balance,
+                "margin_level": 0.0,
+            }
+
+        basket = self.basket([trade.symbol for trade in trades])
+        volumes = [trade.volume for trade in trades]
+        operations = [trade.operation for trade in trades]
+        margin = float(basket.margin(volumes, operations).sum())
+        profit = float(
+            basket.profit(
+                volumes, [trade.openPrice for trade in trades], operations
+            ).sum()
+        )
+        equity = balance + profit
+        return {
+            "margin": margin,
+            "profit": profit,
+            "equity": equity,
+            "free_margin": equity - margin,
+            "margin_level": equity / margin * 100 if margin else 0.0,
+        }
+
+    async def cross_check(
+        self, xtb, volumes: Dict[str, float], tolerance: float = 0.01
+    ) -> Dict[str, tuple]:
+        # compare local buy margins against getMarginTrade, returning the
+        # symbols whose relative difference exceeds the tolerance
+        symbols = list(volumes)
+        local = self.margin(symbols, [volumes[symbol] for symbol in symbols])
+        server = await xtb.getMarginTrades(volumes)
+
+        drift = {}
+        for symbol, margin in zip(symbols, local):
+            if symbol not in server:
+                continue
+            expected = server[symbol]
+            if abs(margin - expected) > tolerance * max(abs(expected), 1e-9):
+                drift[symbol] = (float(margin), expected)
+        self.drift = drift
+        return drift
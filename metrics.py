@@ -0,0 +1,165 @@
+import bisect
+import math
+from typing import Callable, Dict, List, Tuple
+
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+
+HELP = {
+    "xtb_command_seconds": "Request round-trip time per command",
+    "xtb_rate_limit_wait_seconds": "Time spent waiting on a rate limiter",
+    "xtb_stream_messages_total": "Streaming messages received per command",
+    "xtb_stream_decode_seconds": "Time to decode a streaming message",
+    "xtb_message_queue_depth": "Messages waiting in the internal message queue",
+    "xtb_message_queue_lag_seconds": "Time a message spent in the internal queue",
+    "xtb_order_fill_seconds": "Time from transaction response to streamed fill",
+    "xtb_subscriber_queue_depth": "Items waiting in a subscriber queue",
+    "xtb_subscriber_dropped": "Items a subscriber queue dropped or conflated",
+    "xtb_subscriber_lag_seconds": "Queue lag of the last item a subscriber handled",
+    "xtb_link_rtt_seconds": "Smoothed request round-trip time from pings",
+    "xtb_clock_offset_seconds": "Server clock minus local clock",
+    "xtb_stream_staleness_seconds": "Time since the last streaming message",
+    "xtb_reconnects_total": "Full reconnects after losing the streaming socket",
+    "xtb_connection_replacements_total": "Dead request connections replaced",
+}
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        # upper bound of the bucket holding the quantile
+        if not self.count:
+            return math.nan
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return math.inf
+
+
+def format_labels(labels: tuple, extra: str = "") -> str:
+    parts = [f'{key}="{value}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+class Metrics:
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        # (name, sorted label items) -> value
+        self.counters: Dict[tuple, float] = {}
+        self.gauges: Dict[tuple, float] = {}
+        self.histograms: Dict[tuple, Histogram] = {}
+
+        self.hooks: List[Callable] = []
+        self.collectors: List[Callable] = []
+
+    def add_hook(self, hook: Callable):
+        # hook(kind, name, value, labels) is called for every recorded value
+        self.hooks.append(hook)
+
+    def add_collector(self, collector: Callable):
+        # collector(metrics) is called before rendering to refresh gauges
+        self.collectors.append(collector)
+
+    def __notify(self, kind: str, name: str, value: float, labels: dict):
+        for hook in self.hooks:
+            hook(kind, name, value, labels)
+
+    def inc(self, name: str, value: float = 1, /, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+        if self.hooks:
+            self.__notify("counter", name, value, labels)
+
+    def set(self, name: str, value: float, /, **labels):
+        self.gauges[(name, tuple(sorted(labels.items())))] = value
+        if self.hooks:
+            self.__notify("gauge", name, value, labels)
+
+    def observe(self, name: str, value: float, /, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(self.buckets)
+        histogram.observe(value)
+        if self.hooks:
+            self.__notify("histogram", name, value, labels)
+
+    def counter(self, name: str, /, **labels) -> float:
+        return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def gauge(self, name: str, /, **labels) -> float:
+        return self.gauges.get((name, tuple(sorted(labels.items()))), 0)
+
+    def histogram(self, name: str, /, **labels) -> Histogram:
+        return self.histograms.get((name, tuple(sorted(labels.items()))))
+
+    def render_prometheus(self) -> str:
+        for collector in self.collectors:
+            collector(self)
+
+        lines = []
+        for kind, values in (
+            ("counter", self.counters),
+            ("gauge", self.gauges),
+            ("histogram", self.histograms),
+        ):
+            names = sorted({name for name, _ in values})
+            for name in names:
+                if name in HELP:
+                    lines.append(f"# HELP {name} {HELP[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+                for (metric, labels), value in sorted(
+                    values.items(), key=lambda item: item[0]
+                ):
+                    if metric != name:
+                        continue
+                    if kind != "histogram":
+                        lines.append(
+                            f"{name}{format_labels(labels)} {format_value(value)}"
+                        )
+                        continue
+
+                    cumulative = 0
+                    for bound, count in zip(value.buckets + (math.inf,), value.counts):
+                        cumulative += count
+                        bucket = format_labels(labels, f'le="{format_value(bound)}"')
+                        lines.append(f"{name}_bucket{bucket} {cumulative}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {value.sum!r}")
+                    lines.append(f"{name}_count{format_labels(labels)} {value.count}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
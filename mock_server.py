@@ -0,0 +1,473 @@
+import asyncio
+import itertools
+import random
+import time
+from typing import Callable, Dict, Iterable, Optional, Tuple
+import websockets
+from websockets.server import WebSocketServerProtocol
+
+import codec
+from commands.request import MarginMode
+
+# streaming subscribe command -> (stream command, stop command)
+STREAM_SUBSCRIPTIONS = {
+    "getCandles": ("candle", "stopCandles"),
+    "getTrades": ("trade", "stopTrades"),
+    "getBalance": ("balance", "stopBalance"),
+    "getProfits": ("profit", "stopProfits"),
+    "getTickPrices": ("tickPrices", "stopTickPrices"),
+    "getKeepAlive": ("keepAlive", "stopKeepAlive"),
+}
+STOP_COMMANDS = {stop: stream for stream, stop in STREAM_SUBSCRIPTIONS.values()}
+
+# streams that are subscribed to per symbol
+SYMBOL_STREAMS = {"candle", "tickPrices"}
+
+DEFAULT_SYMBOLS = ("EURUSD", "GBPUSD", "USDJPY", "EURPLN", "USDPLN")
+
+
+def synthetic_candles(
+    symbol: str,
+    count: Optional[int] = None,
+    start: Optional[int] = None,
+    period: int = 1,
+) -> Iterable[Tuple[str, dict]]:
+    # an endless feed when count is None
+    ctm = start if start is not None else int(time.time()) // 60 * 60_000
+    price = 1.1
+    for _ in itertools.count() if count is None else range(count):
+        ctm += period * 60_000
+        close = price + random.uniform(-0.001, 0.001)
+        yield "candle", {
+            "symbol": symbol,
+            "ctm": ctm,
+            "ctmString": "",
+            "open": price,
+            "high": max(price, close) + 0.0002,
+            "low": min(price, close) - 0.0002,
+            "close": close,
+            "vol": float(random.randint(1, 100)),
+            "quoteId": 1,
+        }
+        price = close
+
+
+def synthetic_ticks(
+    symbol: str, count: Optional[int] = None
+) -> Iterable[Tuple[str, dict]]:
+    bid = 1.1
+    for _ in itertools.count() if count is None else range(count):
+        bid += random.uniform(-0.0001, 0.0001)
+        spread = random.choice((0.00001, 0.00002, 0.00003))
+        yield "tickPrices", {
+            "symbol": symbol,
+            "ask": bid + spread,
+            "bid": bid,
+            "askVolume": 1_000_000,
+            "bidVolume": 1_000_000,
+            "high": bid + 0.01,
+            "low": bid - 0.01,
+            "level": 0,
+            "quoteId": 1,
+            "spreadRaw": spread,
+            "spreadTable": spread * 10_000,
+            "timestamp": int(time.time() * 1000),
+        }
+
+
+def synthetic_profits(count: int, positions: int = 10) -> Iterable[Tuple[str, dict]]:
+    for i in range(count):
+        position = i % positions + 1
+        yield "profit", {
+            "order": position,
+            "order2": position,
+            "position": position,
+            "profit": round(random.uniform(-100, 100), 2),
+        }
+
+
+def synthetic_balances(count: int) -> Iterable[Tuple[str, dict]]:
+    balance = 10_000.0
+    for _ in range(count):
+        equity = balance + random.uniform(-100, 100)
+        yield "balance", {
+            "balance": balance,
+            "credit": 0.0,
+            "equity": equity,
+            "margin": 100.0,
+            "marginFree": equity - 100.0,
+            "marginLevel": equity,
+        }
+
+
+def synthetic_trades(symbol: str, count: int) -> Iterable[Tuple[str, dict]]:
+    for i in range(count):
+        position = i + 1
+        yield "trade", trade_data(symbol, 0, 0.1, position, position)
+
+
+def trade_data(symbol: str, cmd: int, volume: float, order: int, position: int):
+    return {
+        "symbol": symbol,
+        "cmd": cmd,
+        "volume": volume,
+        "order": position,
+        "order2": order,
+        "position": position,
+        "openPrice": 1.1,
+        "openTime": int(time.time() * 1000),
+        "closePrice": 1.1,
+        "profit": 0.0,
+        "closed": False,
+        "state": "Modified",
+        "type": 0,
+    }
+
+
+class MockXTBServer:
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 0,
+        stream_port: int = 0,
+        latency: float = 0,
+        jitter: float = 0,
+        fill_delay: float = 0,
+        keepalive_interval: Optional[float] = 3,
+        symbols: Iterable[str] = DEFAULT_SYMBOLS,
+    ):
+        self.host = host
+        self.port = port
+        self.stream_port = stream_port
+
+        # injected delay before every command response, in seconds
+        self.latency = latency
+        self.jitter = jitter
+        # delay between a tradeTransaction response and its streamed fill
+        self.fill_delay = fill_delay
+        self.keepalive_interval = keepalive_interval
+        self.symbols = list(symbols)
+
+        self.servers = []
+        self.request_clients: set = set()
+        # streaming socket -> subscribed streams, symbol streams as tuples
+        self.stream_clients: Dict[WebSocketServerProtocol, set] = {}
+        self.subscriptions_changed = asyncio.Condition()
+
+        self.handlers: Dict[str, Callable] = {
+            "login": self.__login,
+            "logout": lambda arguments: None,
+            "ping": lambda arguments: None,
+            "getServerTime": self.__serverTime,
+            "getSymbol": lambda arguments: self.symbol(arguments["symbol"]),
+            "getAllSymbols": lambda arguments: [self.symbol(s) for s in self.symbols],
+            "getMarginLevel": self.__marginLevel,
+            "getMarginTrade": self.__marginTrade,
+            "getTrades": lambda arguments: [],
+            "getChartLastRequest": self.__chart,
+            "getChartRangeRequest": self.__chart,
+            "tradeTransaction": self.__tradeTransaction,
+        }
+        self.tasks: set = set()
+        self.orders = itertools.count(1000)
+        self.commands = 0
+        self.fail_logins = False
+
+    @property
+    def websocket_url(self) -> str:
+        return f"ws://{self.host}:{self.port}"
+
+    @property
+    def streaming_url(self) -> str:
+        return f"ws://{self.host}:{self.stream_port}"
+
+    def attach(self, xtb):
+        # point a client at this server instead of the XTB endpoints
+        xtb.websocket_url = self.websocket_url
+        xtb.streaming_url = self.streaming_url
+
+    async def start(self):
+        request_server = await websockets.serve(
+            self.__handleRequests, self.host, self.port
+        )
+        stream_server = await websockets.serve(
+            self.__handleStreaming, self.host, self.stream_port
+        )
+        self.servers = [request_server, stream_server]
+        self.port = request_server.sockets[0].getsockname()[1]
+        self.stream_port = stream_server.sockets[0].getsockname()[1]
+        if self.keepalive_interval:
+            self.__spawn(self.__keepAlive())
+
+    async def stop(self):
+        for task in list(self.tasks):
+            task.cancel()
+        for server in self.servers:
+            server.close()
+            await server.wait_closed()
+        self.servers = []
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *_):
+        await self.stop()
+
+    def handle(self, command: str, handler: Callable):
+        # handler(arguments) returns returnData or raises to fail the command
+        self.handlers[command] = handler
+
+    def symbol(self, symbol: str) -> dict:
+        if symbol not in self.symbols:
+            raise Exception(f"Unknown symbol: {symbol}")
+        # six letters are a currency pair, anything else a dollar CFD
+        forex = len(symbol) == 6 and symbol.isalpha()
+        return {
+            "symbol": symbol,
+            "ask": 1.1001,
+            "bid": 1.1,
+            "high": 1.12,
+            "low": 1.09,
+            "precision": 5,
+            "contractSize": 100_000,
+            "currency": symbol[:3] if forex else "USD",
+            "currencyProfit": symbol[3:6] if forex else "USD",
+            "leverage": 3.33,
+            "marginMode": (
+                MarginMode.FOREX.value if forex else MarginMode.CFD_LEVERAGED.value
+            ),
+            "lotMin": 0.01,
+            "lotMax": 100.0,
+            "lotStep": 0.01,
+            "time": int(time.time() * 1000),
+        }
+
+    def __spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def __keepAlive(self):
+        while True:
+            await asyncio.sleep(self.keepalive_interval)
+            await self.publish("keepAlive", {"timestamp": int(time.time() * 1000)})
+
+    def __login(self, arguments):
+        if self.fail_logins:
+            raise Exception("Invalid login")
+
+    def __serverTime(self, arguments):
+        now = int(time.time() * 1000)
+        return {"time": now, "timeString": time.ctime(now / 1000)}
+
+    def __marginLevel(self, arguments):
+        return {
+            "balance": 10_000.0,
+            "credit": 0.0,
+            "currency": "USD",
+            "equity": 10_000.0,
+            "margin": 0.0,
+            "margin_free": 10_000.0,
+            "margin_level": 0.0,
+        }
+
+    def __marginTrade(self, arguments):
+        # forex margin is in the base currency and does not depend on the
+        # price, CFD margin is taken on the contract value
+        symbol = self.symbol(arguments["symbol"])
+        margin = arguments["volume"] * symbol["contractSize"] * symbol["leverage"] / 100
+        if symbol["marginMode"] != MarginMode.FOREX.value:
+            margin *= symbol["ask"]
+        return {"margin": round(margin * self.__rate(symbol["currency"]), 2)}
+
+    def __rate(self, currency: str) -> float:
+        # to the account currency at the mid price; currencies without a
+        # listed pair are taken at par
+        account = self.__marginLevel({})["currency"]
+        if currency == account:
+            return 1.0
+        for pair, inverse in ((currency + account, False), (account + currency, True)):
+            if pair in self.symbols:
+                quote = self.symbol(pair)
+                mid = (quote["bid"] + quote["ask"]) / 2
+                return 1 / mid if inverse else mid
+        return 1.0
+
+    def __chart(self, arguments):
+        info = arguments["info"]
+        period = info["period"] * 60_000
+        start = info["start"] // period * period
+        end = info.get("end") or int(time.time() * 1000)
+        return {
+            "digits": 5,
+            "rateInfos": [
+                {
+                    "ctm": ctm,
+                    "ctmString": "",
+                    "open": 110_000,
+                    "high": 20,
+                    "low": -10,
+                    "close": 5,
+                    "vol": 1.0,
+                }
+                for ctm in range(start, end, period)
+            ],
+        }
+
+    def __tradeTransaction(self, arguments):
+        info = arguments["tradeTransInfo"]
+        order = next(self.orders)
+        self.__spawn(self.__fill(info, order))
+        return {"order": order}
+
+    async def __fill(self, info: dict, order: int):
+        if self.fill_delay:
+            await asyncio.sleep(self.fill_delay)
+        await self.publish(
+            "trade",
+            trade_data(info["symbol"], info["cmd"], info["volume"], order, order + 1),
+        )
+
+    async def __handleRequests(self, websocket: WebSocketServerProtocol, path=None):
+        self.request_clients.add(websocket)
+        try:
+            async for message in websocket:
+                self.__spawn(self.__respond(websocket, codec.loads(message)))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            self.request_clients.discard(websocket)
+
+    async def __respond(self, websocket: WebSocketServerProtocol, request: dict):
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+
+        self.commands += 1
+        command = request.get("command")
+        handler = self.handlers.get(command)
+        try:
+            if handler is None:
+                raise Exception(f"Unknown command: {command}")
+            response = {
+                "status": True,
+                "returnData": handler(request.get("arguments", {})),
+            }
+            if command == "login":
+                response = {"status": True, "streamSessionId": "mock-session"}
+        except Exception as e:
+            response = {"status": False, "errorCode": "MOCK", "errorDescr": str(e)}
+
+        if "customTag" in request:
+            response["customTag"] = request["customTag"]
+        try:
+            await websocket.send(codec.dumps(response))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def __handleStreaming(self, websocket: WebSocketServerProtocol, path=None):
+        subscriptions = self.stream_clients[websocket] = set()
+        try:
+            async for message in websocket:
+                request = codec.loads(message)
+                command = request.get("command")
+                if command in STREAM_SUBSCRIPTIONS:
+                    stream = STREAM_SUBSCRIPTIONS[command][0]
+                    subscriptions.add(self.__streamKey(stream, request))
+                elif command in STOP_COMMANDS:
+                    subscriptions.discard(
+                        self.__streamKey(STOP_COMMANDS[command], request)
+                    )
+                else:
+                    continue
+                async with self.subscriptions_changed:
+                    self.subscriptions_changed.notify_all()
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            self.stream_clients.pop(websocket, None)
+
+    def subscribers(self, stream: str, symbol: Optional[str] = None) -> int:
+        key = (stream, symbol) if stream in SYMBOL_STREAMS else stream
+        return sum(key in s for s in self.stream_clients.values())
+
+    async def wait_subscribed(
+        self, stream: str, symbol: Optional[str] = None, timeout: float = 10
+    ):
+        # streaming subscriptions are fire and forget, so publishing right
+        # after subscribing can race the server
+        async with self.subscriptions_changed:
+            await asyncio.wait_for(
+                self.subscriptions_changed.wait_for(
+                    lambda: self.subscribers(stream, symbol)
+                ),
+                timeout,
+            )
+
+    def __streamKey(self, stream: str, data: dict):
+        if stream in SYMBOL_STREAMS:
+            return stream, data.get("symbol")
+        return stream
+
+    async def publish(self, command: str, data: dict) -> int:
+        # send one streaming message to every subscribed client, returning
+        # how many received it
+        key = self.__streamKey(command, data)
+        message = codec.dumps({"command": command, "data": data})
+        sent = 0
+        for websocket, subscriptions in list(self.stream_clients.items()):
+            if key not in subscriptions:
+                continue
+            try:
+                await websocket.send(message)
+                sent += 1
+            except websockets.exceptions.ConnectionClosed:
+                pass
+        return sent
+
+    async def replay(
+        self,
+        messages: Iterable[Tuple[str, dict]],
+        rate: Optional[float] = None,
+        on_send: Optional[Callable] = None,
+    ) -> int:
+        # (command, data) pairs, paced at rate messages per second or as fast
+        # as possible
+        started = time.monotonic()
+        count = 0
+        for count, (command, data) in enumerate(messages, 1):
+            if rate:
+                ahead = started + count / rate - time.monotonic()
+                if ahead > 0:
+                    await asyncio.sleep(ahead)
+            if on_send:
+                on_send(command, data)
+            await self.publish(command, data)
+        return count
+
+    async def disconnect(self, requests: bool = True, streaming: bool = True):
+        # drop client sockets to exercise reconnect handling
+        sockets = []
+        if requests:
+            sockets += list(self.request_clients)
+        if streaming:
+            sockets += list(self.stream_clients)
+        await asyncio.gather(*[websocket.close() for websocket in sockets])
+
+    async def disconnect_after(self, delay: float, **options):
+        await asyncio.sleep(delay)
+        await self.disconnect(**options)
+
+
+async def serve(port: int = 8765, stream_port: int = 8766, rate: float = 10):
+    server = MockXTBServer(port=port, stream_port=stream_port)
+    await server.start()
+    print(f"Serving {server.websocket_url} and {server.streaming_url}")
+    await server.wait_subscribed("candle", server.symbols[0], timeout=None)
+    feeds = [synthetic_candles(symbol) for symbol in server.symbols]
+    await server.replay(itertools.chain.from_iterable(zip(*feeds)), rate=rate)
+
+
+if __name__ == "__main__":
+    asyncio.run(serve())
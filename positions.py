@@ -0,0 +1,152 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from commands.request import OperationType, TradeRecord
+from commands.streaming import StreamingBalanceRecord, StreamingTradeRecord
+
+DIRECTIONS = {OperationType.BUY.value: 1, OperationType.SELL.value: -1}
+
+
+class PositionBook:
+    def __init__(self):
+        self.by_position: Dict[int, StreamingTradeRecord] = {}
+        # order and order2 ids -> position id
+        self.by_order: Dict[int, int] = {}
+        self.by_symbol: Dict[str, Set[int]] = {}
+
+        self.exposure: Dict[str, float] = {}
+        self.floating_profit = 0.0
+        self.margin = 0.0
+        self.equity = 0.0
+
+    def __resolve(self, key: int) -> Optional[int]:
+        if key in self.by_position:
+            return key
+        return self.by_order.get(key)
+
+    def __getitem__(self, key: int) -> StreamingTradeRecord:
+        position = self.__resolve(key)
+        if position is None:
+            raise KeyError(key)
+        return self.by_position[position]
+
+    def get(self, key: int, default=None) -> Optional[StreamingTradeRecord]:
+        position = self.__resolve(key)
+        return default if position is None else self.by_position[position]
+
+    def __contains__(self, key: int) -> bool:
+        return self.__resolve(key) is not None
+
+    def __len__(self):
+        return len(self.by_position)
+
+    def __iter__(self):
+        return iter(self.by_position)
+
+    def values(self):
+        return self.by_position.values()
+
+    def items(self):
+        return self.by_position.items()
+
+    def symbol(self, symbol: str) -> List[StreamingTradeRecord]:
+        return [self.by_position[p] for p in self.by_symbol.get(symbol, ())]
+
+    def __account(self, trade: StreamingTradeRecord, sign: int):
+        direction = DIRECTIONS.get(trade.operation)
+        if direction:
+            exposure = self.exposure.get(trade.symbol, 0.0)
+            exposure += sign * direction * (trade.volume or 0)
+            if abs(exposure) < 1e-9:
+                self.exposure.pop(trade.symbol, None)
+            else:
+                self.exposure[trade.symbol] = exposure
+        self.floating_profit += sign * (trade.profit or 0)
+
+    def update(self, trade: StreamingTradeRecord):
+        if trade.closed or trade.state == "Deleted":
+            self.remove(trade.position)
+            return
+
+        previous = self.by_position.get(trade.position)
+        if previous is not None:
+            self.__account(previous, -1)
+            if trade.profit is None:
+                trade.profit = previous.profit
+
+        self.by_position[trade.position] = trade
+        for order in (trade.order, trade.order2):
+            if order is not None and order != trade.position:
+                self.by_order[order] = trade.position
+        self.by_symbol.setdefault(trade.symbol, set()).add(trade.position)
+        self.__account(trade, 1)
+
+    def update_profit(self, position: int, profit: float):
+        trade = self.by_position.get(position)
+        if trade is None:
+            return
+        self.floating_profit += (profit or 0) - (trade.profit or 0)
+        trade.profit = profit
+
+    def update_balance(self, balance: StreamingBalanceRecord):
+        self.margin = balance.margin
+        self.equity = balance.equity
+
+    def remove(self, key: int) -> Optional[StreamingTradeRecord]:
+        position = self.__resolve(key)
+        if position is None:
+            return None
+
+        trade = self.by_position.pop(position)
+        self.__account(trade, -1)
+        for order in (trade.order, trade.order2):
+            if self.by_order.get(order) == position:
+                del self.by_order[order]
+        symbol_positions = self.by_symbol.get(trade.symbol)
+        if symbol_positions:
+            symbol_positions.discard(position)
+            if not symbol_positions:
+                del self.by_symbol[trade.symbol]
+        return trade
+
+    def reconcile(
+        self, trades: Iterable[TradeRecord], refresh: bool = False
+    ) -> Tuple[list, list]:
+        # bring the book in line with a getTrades snapshot, returning the
+        # positions that were added and removed; with refresh, positions
+        # already in the book are overwritten with the server's view too
+        server = {trade.position: trade for trade in trades}
+
+        removed = [p for p in list(self.by_position) if p not in server]
+        for position in removed:
+            self.remove(position)
+
+        added = []
+        for position, trade in server.items():
+            known = position in self.by_position
+            if known and not refresh:
+                continue
+            self.update(
+                StreamingTradeRecord(
+                    symbol=trade.symbol,
+                    volume=trade.volume,
+                    openPrice=trade.open_price,
+                    profit=trade.profit,
+                    order=trade.order,
+                    order2=trade.order2,
+                    position=trade.position,
+                    cmd=trade.operation,
+                    closed=False,
+                )
+            )
+            if not known:
+                added.append(position)
+        return added, removed
+
+    def snapshot(self) -> dict:
+        return {
+            "positions": len(self.by_position),
+            "exposure": dict(self.exposure),
+            "floating_profit": self.floating_profit,
+            "margin": self.margin,
+            "equity": self.equity,
+        }
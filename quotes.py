@@ -0,0 +1,135 @@
+import asyncio
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from commands.record import Record
+from commands.streaming import StreamingTickRecord
+
+
+class Quote(Record):
+    __slots__ = ("symbol", "bid", "ask", "spread", "timestamp")
+
+
+class QuoteBook:
+    # latest top-of-book prices, one row per symbol in parallel arrays so
+    # reads are an index lookup and portfolio maths can take whole columns
+    def __init__(self, capacity: int = 256):
+        self.index: Dict[str, int] = {}
+        self.symbols: List[str] = []
+
+        self.bid = np.full(capacity, np.nan)
+        self.ask = np.full(capacity, np.nan)
+        self.spread = np.full(capacity, np.nan)
+        self.timestamp = np.zeros(capacity, dtype=np.int64)
+        self.versions = np.zeros(capacity, dtype=np.int64)
+        self.version = 0
+
+        # symbol, or None for any symbol -> futures woken on the next update
+        self.waiters: Dict[Optional[str], List[asyncio.Future]] = {}
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self.index
+
+    def __row(self, symbol: str) -> int:
+        row = self.index.get(symbol)
+        if row is not None:
+            return row
+
+        row = len(self.symbols)
+        if row == len(self.bid):
+            capacity = 2 * row
+            for name, fill in (
+                ("bid", np.nan),
+                ("ask", np.nan),
+                ("spread", np.nan),
+                ("timestamp", 0),
+                ("versions", 0),
+            ):
+                column = getattr(self, name)
+                grown = np.full(capacity, fill, dtype=column.dtype)
+                grown[:row] = column
+                setattr(self, name, grown)
+
+        self.index[symbol] = row
+        self.symbols.append(symbol)
+        return row
+
+    def update(
+        self,
+        symbol: str,
+        bid: float,
+        ask: float,
+        timestamp: int,
+        spread: Optional[float] = None,
+    ):
+        row = self.__row(symbol)
+        self.bid[row] = bid
+        self.ask[row] = ask
+        self.spread[row] = ask - bid if spread is None else spread
+        self.timestamp[row] = timestamp or 0
+        self.version += 1
+        self.versions[row] = self.version
+
+        if self.waiters:
+            self.__wake(symbol)
+
+    def update_tick(self, tick: StreamingTickRecord):
+        # deeper levels of the book are not kept
+        if tick.level:
+            return
+        self.update(tick.symbol, tick.bid, tick.ask, tick.timestamp, tick.spreadRaw)
+
+    def __wake(self, symbol: str):
+        for key in (symbol, None):
+            for future in self.waiters.pop(key, ()):
+                if not future.done():
+                    future.set_result(symbol)
+
+    def quote(self, symbol: str) -> Optional[Quote]:
+        row = self.index.get(symbol)
+        if row is None:
+            return None
+        return Quote(
+            symbol=symbol,
+            bid=float(self.bid[row]),
+            ask=float(self.ask[row]),
+            spread=float(self.spread[row]),
+            timestamp=int(self.timestamp[row]),
+        )
+
+    def bid_ask(self, symbol: str) -> Tuple[float, float]:
+        row = self.index[symbol]
+        return float(self.bid[row]), float(self.ask[row])
+
+    def mid(self, symbol: str) -> float:
+        row = self.index[symbol]
+        return float(self.bid[row] + self.ask[row]) / 2
+
+    def rows(self, symbols: Iterable[str]) -> np.ndarray:
+        # unknown symbols map to -1
+        return np.array(
+            [self.index.get(symbol, -1) for symbol in symbols], dtype=np.intp
+        )
+
+    async def wait(
+        self, symbol: Optional[str] = None, timeout: Optional[float] = None
+    ) -> Quote:
+        # the next quote for symbol, or for any symbol when it is None
+        future = asyncio.get_event_loop().create_future()
+        self.waiters.setdefault(symbol, []).append(future)
+        try:
+            updated = await asyncio.wait_for(future, timeout)
+        finally:
+            waiters = self.waiters.get(symbol)
+            if waiters and future in waiters:
+                waiters.remove(future)
+                if not waiters:
+                    del self.waiters[symbol]
+        return self.quote(updated)
+
+    def snapshot(self) -> Dict[str, Quote]:
+        return {symbol: self.quote(symbol) for symbol in self.symbols}
@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int = 1):
+        if rate <= 0:
+            raise Exception("Rate must be positive")
+        if burst < 1:
+            raise Exception("Burst must be at least 1")
+
+        self.rate = rate
+        self.burst = burst
+        self.tokens: float = burst
+        self.updated_at = time.monotonic()
+
+        # asyncio.Lock wakes waiters in FIFO order, which gives fair queuing
+        # across concurrent callers
+        self.lock = asyncio.Lock()
+
+        self.acquired = 0
+        self.queued = 0
+        self.waited = 0
+        self.wait_time = 0.0
+
+    def __refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        self.queued += 1
+        try:
+            async with self.lock:
+                self.__refill()
+                if self.tokens < 1:
+                    delay = (1 - self.tokens) / self.rate
+                    self.waited += 1
+                    self.wait_time += delay
+                    await asyncio.sleep(delay)
+                    self.__refill()
+
+                self.tokens -= 1
+                self.acquired += 1
+        finally:
+            self.queued -= 1
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *_):
+        pass
+
+    def stats(self) -> dict:
+        return {
+            "acquired": self.acquired,
+            "waited": self.waited,
+            "wait_time": self.wait_time,
+            "queued": self.queued,
+        }
+
+    def __repr__(self):
+        return f"TokenBucket(rate={self.rate}, burst={self.burst}, tokens={self.tokens:.2f})"
@@ -0,0 +1,51 @@
+import gzip
+import time
+from typing import Iterable, Iterator, Optional, Tuple
+
+STREAM = "stream"
+COMMAND = "command"
+RESPONSE = "response"
+
+CHANNELS = (STREAM, COMMAND, RESPONSE)
+
+
+class SessionRecorder:
+    # one "timestamp<TAB>channel<TAB>raw message" line per message; appending
+    # to an existing log adds a new gzip member, which readers handle
+    def __init__(self, path: str, compresslevel: int = 6):
+        self.path = path
+        self.file = gzip.open(path, "at", compresslevel=compresslevel, encoding="utf-8")
+        self.count = 0
+
+    def write(self, channel: str, message, timestamp: Optional[float] = None):
+        if isinstance(message, (bytes, bytearray, memoryview)):
+            message = bytes(message).decode()
+        if timestamp is None:
+            timestamp = time.time()
+        # newlines can only be whitespace between JSON tokens
+        message = message.replace("\n", " ")
+        self.file.write(f"{timestamp:.6f}\t{channel}\t{message}\n")
+        self.count += 1
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def read_session(
+    path: str, channels: Iterable[str] = CHANNELS
+) -> Iterator[Tuple[float, str, str]]:
+    channels = set(channels)
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            timestamp, channel, message = line.rstrip("\n").split("\t", 2)
+            if channel in channels:
+                yield float(timestamp), channel, message
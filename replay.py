@@ -0,0 +1,47 @@
+import asyncio
+import time
+from typing import Optional
+
+from recording import STREAM, read_session
+from xtbapi import XTB
+
+
+class ReplayXTB(XTB):
+    # feeds a recorded session through the same decoding, position tracking
+    # and dispatch as a live client; callbacks are registered as usual
+    def __init__(self, path: str, speed: Optional[float] = None, **options):
+        options.setdefault("health_check_interval", None)
+        super().__init__(reconnect=False, **options)
+        self.path = path
+        # None replays as fast as possible, otherwise a wall-clock multiplier
+        self.speed = speed
+        self.replayed = 0
+
+    async def login(self, userId: Optional[str] = None, password: Optional[str] = None):
+        raise Exception("Replay sessions do not log in")
+
+    async def run(self) -> int:
+        self.stopped = False
+        if not self.tasks:
+            self.startDispatch()
+
+        started = time.monotonic()
+        first = None
+        count = 0
+        for timestamp, _, message in read_session(self.path, channels=(STREAM,)):
+            if self.stopped:
+                break
+            if self.speed:
+                if first is None:
+                    first = timestamp
+                ahead = started + (timestamp - first) / self.speed - time.monotonic()
+                if ahead > 0:
+                    await asyncio.sleep(ahead)
+            await self.processStreamingMessage(message)
+            count += 1
+
+        # wait until every callback has seen the replayed messages
+        await self.message_queue.join()
+        await self.dispatcher.join()
+        self.replayed += count
+        return count
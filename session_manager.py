@@ -0,0 +1,157 @@
+import asyncio
+from typing import Callable, Dict, Optional
+
+from candle_cache import CandleCache
+from dispatch import Subscriber
+from rate_limit import TokenBucket
+from symbol_cache import SymbolCache
+from xtb_types import BatchResult
+from xtbapi import XTB
+
+
+class XTBSessionManager:
+    def __init__(
+        self,
+        real: bool = False,
+        login_rate: float = 1,
+        login_burst: int = 2,
+        symbol_cache: Optional[SymbolCache] = None,
+        candle_cache: Optional[CandleCache] = None,
+        **options,
+    ):
+        self.real = real
+        self.options = options
+        self.login_limiter = TokenBucket(login_rate, login_burst)
+
+        # metadata and history are the same for every account, so all
+        # sessions share one copy
+        self.symbol_cache = symbol_cache if symbol_cache is not None else SymbolCache()
+        self.candle_cache = candle_cache
+
+        self.sessions: Dict[str, XTB] = {}
+        self.credentials: Dict[str, tuple] = {}
+
+        # symbol -> {session name: (callback, subscriber options)}
+        self.candle_subscribers: Dict[str, Dict[str, tuple]] = {}
+        # symbol -> {session name: subscriber on the market data session}
+        self.candle_queues: Dict[str, Dict[str, Subscriber]] = {}
+        self.market_data_session: Optional[str] = None
+
+    def addSession(self, name: str, userId: str, password: str, **options) -> XTB:
+        if name in self.sessions:
+            raise Exception(f"Session already exists: {name}")
+
+        session = XTB(
+            real=self.real,
+            symbol_cache=self.symbol_cache,
+            candle_cache=self.candle_cache,
+            **{**self.options, **options},
+        )
+        self.sessions[name] = session
+        self.credentials[name] = (userId, password)
+        return session
+
+    def __getitem__(self, name: str) -> XTB:
+        return self.sessions[name]
+
+    def __iter__(self):
+        return iter(self.sessions)
+
+    def __len__(self):
+        return len(self.sessions)
+
+    async def __login(self, name: str):
+        await self.login_limiter.acquire()
+        await self.sessions[name].login(*self.credentials[name])
+        if self.market_data_session is None:
+            self.market_data_session = name
+
+    async def loginAll(self) -> BatchResult:
+        names = [
+            name for name, session in self.sessions.items() if not session.connections
+        ]
+        results = await asyncio.gather(
+            *[self.__login(name) for name in names], return_exceptions=True
+        )
+
+        batch = BatchResult()
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                batch.errors[name] = result
+            else:
+                batch[name] = self.sessions[name]
+        return batch
+
+    async def __addQueue(self, session: str, symbol: str):
+        # a single streaming subscription per symbol serves every account,
+        # each through its own queue so a slow account holds up no other
+        callback, options = self.candle_subscribers[symbol][session]
+        market_data = self.sessions[self.market_data_session]
+        self.candle_queues.setdefault(symbol, {})[session] = (
+            await market_data.addCandleSubscriber(symbol, callback, **options)
+        )
+
+    async def __removeQueue(self, session: str, symbol: str):
+        # the market data session stops the stream with the last queue
+        queues = self.candle_queues.get(symbol, {})
+        subscriber = queues.pop(session, None)
+        if not queues:
+            self.candle_queues.pop(symbol, None)
+        if subscriber is not None and self.market_data_session is not None:
+            await self.sessions[self.market_data_session].removeCandleSubscriber(
+                symbol, subscriber
+            )
+
+    async def subscribeCandles(
+        self, session: str, symbol: str, callback: Callable, **options
+    ):
+        if session not in self.sessions:
+            raise Exception(f"Unknown session: {session}")
+        if self.market_data_session is None:
+            raise Exception("No session is logged in")
+
+        await self.__removeQueue(session, symbol)
+        self.candle_subscribers.setdefault(symbol, {})[session] = (callback, options)
+        await self.__addQueue(session, symbol)
+
+    async def unsubscribeCandles(self, session: str, symbol: str):
+        subscribers = self.candle_subscribers.get(symbol, {})
+        subscribers.pop(session, None)
+        if not subscribers:
+            self.candle_subscribers.pop(symbol, None)
+        await self.__removeQueue(session, symbol)
+
+    async def removeSession(self, name: str):
+        for symbol, subscribers in list(self.candle_subscribers.items()):
+            if name in subscribers:
+                await self.unsubscribeCandles(name, symbol)
+
+        session = self.sessions.pop(name)
+        self.credentials.pop(name)
+        await session.disconnect()
+
+        if self.market_data_session == name:
+            self.market_data_session = None
+            await self.__moveMarketData()
+
+    async def __moveMarketData(self):
+        for name, session in self.sessions.items():
+            if session.connections:
+                self.market_data_session = name
+                break
+        else:
+            return
+
+        # the queues went with the old session
+        self.candle_queues = {}
+        for symbol, subscribers in self.candle_subscribers.items():
+            for session in subscribers:
+                await self.__addQueue(session, symbol)
+
+    async def shutdownAll(self):
+        await asyncio.gather(
+            *[session.disconnect() for session in self.sessions.values()],
+            return_exceptions=True,
+        )
+        self.candle_queues = {}
+        self.market_data_session = None
@@ -0,0 +1,283 @@
+import asyncio
+import itertools
+import multiprocessing
+import struct
+from multiprocessing import shared_memory
+from typing import List, Optional
+
+from commands.request import Candle
+from commands.streaming import (
+    StreamingBalanceRecord,
+    StreamingProfitRecord,
+    StreamingTickRecord,
+    StreamingTradeRecord,
+)
+
+HEADER = struct.Struct("<QQ")  # slot count, last written sequence
+SLOT_HEADER = struct.Struct("<QB")  # sequence, record kind
+SLOT_SIZE = 128
+
+# kind -> (stream, record class, fields, layout); the layouts must fit in
+# SLOT_SIZE - SLOT_HEADER.size bytes
+LAYOUTS = {
+    1: (
+        "candle",
+        Candle,
+        ("symbol", "ctm", "open", "high", "low", "close", "vol"),
+        struct.Struct("<24sqddddd"),
+    ),
+    2: (
+        "trade",
+        StreamingTradeRecord,
+        (
+            "symbol",
+            "position",
+            "order",
+            "order2",
+            "operation",
+            "volume",
+            "openPrice",
+            "closePrice",
+            "profit",
+            "openTime",
+            "closed",
+        ),
+        struct.Struct("<24sqqqbddddq?"),
+    ),
+    3: (
+        "profit",
+        StreamingProfitRecord,
+        ("position", "order", "order2", "profit"),
+        struct.Struct("<qqqd"),
+    ),
+    4: (
+        "balance",
+        StreamingBalanceRecord,
+        ("balance", "equity", "margin", "freeMargin", "marginLevel"),
+        struct.Struct("<ddddd"),
+    ),
+    5: (
+        "tickPrices",
+        StreamingTickRecord,
+        ("symbol", "timestamp", "bid", "ask", "spreadRaw", "level"),
+        struct.Struct("<24sqdddi"),
+    ),
+}
+KINDS = {stream: kind for kind, (stream, *_) in LAYOUTS.items()}
+RECORD_KINDS = {record_class: kind for kind, (_, record_class, *_) in LAYOUTS.items()}
+
+# methods workers may call on the owning XTB through the command channel
+ALLOWED_COMMANDS = {
+    "buy",
+    "sell",
+    "close",
+    "getSymbol",
+    "getSymbolSpec",
+    "getSymbols",
+    "getMarginTrade",
+    "getMarginTrades",
+    "getMarginLevel",
+    "getTrades",
+    "getCandles",
+    "getServerTime",
+}
+
+
+def encode_field(value):
+    if isinstance(value, str):
+        return value.encode()
+    return 0 if value is None else value
+
+
+class SharedRing:
+    def __init__(self, memory: shared_memory.SharedMemory):
+        self.memory = memory
+        self.buffer = memory.buf
+        self.slots, _ = HEADER.unpack_from(self.buffer, 0)
+
+    @classmethod
+    def create(cls, name: Optional[str], slots: int) -> "SharedRing":
+        memory = shared_memory.SharedMemory(
+            name=name, create=True, size=HEADER.size + slots * SLOT_SIZE
+        )
+        HEADER.pack_into(memory.buf, 0, slots, 0)
+        return cls(memory)
+
+    @classmethod
+    def attach(cls, name: str) -> "SharedRing":
+        return cls(shared_memory.SharedMemory(name=name))
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    @property
+    def sequence(self) -> int:
+        return HEADER.unpack_from(self.buffer, 0)[1]
+
+    def offset(self, sequence: int) -> int:
+        return HEADER.size + (sequence % self.slots) * SLOT_SIZE
+
+    def close(self):
+        self.buffer = None
+        self.memory.close()
+
+
+class SharedStreamPublisher:
+    def __init__(self, xtb, name: Optional[str] = None, slots: int = 65536):
+        self.xtb = xtb
+        self.ring = SharedRing.create(name, slots)
+        self.sequence = 0
+        self.subscribers = []
+
+    @property
+    def name(self) -> str:
+        return self.ring.name
+
+    def start(self, streams=("candle", "trade", "profit", "balance")):
+        for stream in streams:
+            if stream not in KINDS:
+                raise Exception(f"Cannot publish stream: {stream}")
+            self.subscribers.append(
+                (
+                    stream,
+                    self.xtb.dispatcher.subscribe(
+                        stream, self.publish, maxsize=100_000
+                    ),
+                )
+            )
+
+    async def publish(self, record):
+        self.write(record)
+
+    def write(self, record):
+        kind = RECORD_KINDS[type(record)]
+        _, _, fields, layout = LAYOUTS[kind]
+
+        sequence = self.sequence + 1
+        buffer = self.ring.buffer
+        offset = self.ring.offset(sequence)
+
+        # seqlock: readers discard a slot whose sequence changed while they
+        # were reading it
+        SLOT_HEADER.pack_into(buffer, offset, 0, kind)
+        layout.pack_into(
+            buffer,
+            offset + SLOT_HEADER.size,
+            *[encode_field(getattr(record, field)) for field in fields],
+        )
+        SLOT_HEADER.pack_into(buffer, offset, sequence, kind)
+        HEADER.pack_into(buffer, 0, self.ring.slots, sequence)
+        self.sequence = sequence
+
+    def close(self):
+        for stream, subscriber in self.subscribers:
+            self.xtb.dispatcher.unsubscribe(stream, subscriber)
+        self.subscribers = []
+        self.ring.close()
+        self.ring.memory.unlink()
+
+
+class SharedStreamReader:
+    def __init__(self, name: str, start_at_latest: bool = True):
+        self.ring = SharedRing.attach(name)
+        self.next_sequence = self.ring.sequence + 1 if start_at_latest else 1
+        self.lost = 0
+
+    def read_raw(self, limit: Optional[int] = None) -> List[tuple]:
+        # (stream, values) tuples unpacked straight from the shared buffer
+        buffer = self.ring.buffer
+        latest = self.ring.sequence
+        if latest - self.next_sequence >= self.ring.slots:
+            skipped = latest - self.ring.slots + 1
+            self.lost += skipped - self.next_sequence
+            self.next_sequence = skipped
+
+        end = (
+            latest + 1 if limit is None else min(latest + 1, self.next_sequence + limit)
+        )
+        records = []
+        for sequence in range(self.next_sequence, end):
+            offset = self.ring.offset(sequence)
+            written, kind = SLOT_HEADER.unpack_from(buffer, offset)
+            if written != sequence:
+                self.lost += 1
+                continue
+            stream, _, _, layout = LAYOUTS[kind]
+            values = layout.unpack_from(buffer, offset + SLOT_HEADER.size)
+            if SLOT_HEADER.unpack_from(buffer, offset)[0] != sequence:
+                self.lost += 1
+                continue
+            records.append((stream, values))
+        self.next_sequence = max(self.next_sequence, end)
+        return records
+
+    def read(self, limit: Optional[int] = None) -> list:
+        records = []
+        for stream, values in self.read_raw(limit):
+            _, record_class, fields, _ = LAYOUTS[KINDS[stream]]
+            record = record_class.from_wire({})
+            for field, value in zip(fields, values):
+                if isinstance(value, bytes):
+                    value = value.rstrip(b"\0").decode()
+                setattr(record, field, value)
+            records.append(record)
+        return records
+
+    def close(self):
+        self.ring.close()
+
+
+class CommandChannel:
+    # create before starting the worker processes so the queues are inherited
+    def __init__(self, workers: int):
+        self.requests = multiprocessing.Queue()
+        self.responses = [multiprocessing.Queue() for _ in range(workers)]
+
+    def client(self, worker: int) -> "CommandClient":
+        return CommandClient(self, worker)
+
+    async def serve(self, xtb):
+        loop = asyncio.get_event_loop()
+        while True:
+            request = await loop.run_in_executor(None, self.requests.get)
+            if request is None:
+                break
+            asyncio.create_task(self.__handle(xtb, *request))
+
+    async def __handle(self, xtb, worker: int, call_id: int, method: str, args, kwargs):
+        try:
+            if method not in ALLOWED_COMMANDS:
+                raise Exception(f"Command not allowed: {method}")
+            result = await getattr(xtb, method)(*args, **kwargs)
+            if hasattr(result, "xtb"):
+                # positions hold a reference to the client, send their fields
+                result = {k: v for k, v in vars(result).items() if k != "xtb"}
+            response = (call_id, result, None)
+        except Exception as e:
+            response = (call_id, None, repr(e))
+        self.responses[worker].put(response)
+
+    def stop(self):
+        self.requests.put(None)
+
+
+class CommandClient:
+    def __init__(self, channel: CommandChannel, worker: int):
+        self.channel = channel
+        self.worker = worker
+        self.call_ids = itertools.count(1)
+
+    def call(self, method: str, *args, timeout: Optional[float] = None, **kwargs):
+        call_id = next(self.call_ids)
+        self.channel.requests.put((self.worker, call_id, method, args, kwargs))
+        while True:
+            response_id, result, error = self.channel.responses[self.worker].get(
+                timeout=timeout
+            )
+            if response_id != call_id:
+                # a reply to an earlier call that timed out
+                continue
+            if error:
+                raise Exception(f"Command failed: {error}")
+            return result
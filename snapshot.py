@@ -0,0 +1,105 @@
+import gzip
+import os
+import pickle
+import time
+from typing import Optional
+
+from candles import CandleSeries
+
+SNAPSHOT_VERSION = 1
+
+
+def capture(xtb, candle_window: Optional[int] = 1000) -> dict:
+    # the local state that is slow to rebuild from the server; candle series
+    # keep only their last candle_window bars
+    quotes = xtb.quotes
+    rows = len(quotes)
+
+    candles = []
+    for (symbol, period), series in xtb.candle_series.items():
+        if not len(series):
+            continue
+        columns = series.columns()
+        if candle_window is not None:
+            columns = {
+                name: column[-candle_window:] for name, column in columns.items()
+            }
+        candles.append((symbol, period, columns))
+
+    return {
+        "version": SNAPSHOT_VERSION,
+        "time": time.time(),
+        "account_currency": xtb.account_currency,
+        "positions": list(xtb.positions.values()),
+        "account": (xtb.positions.margin, xtb.positions.equity),
+        "symbols": xtb.symbol_cache.export(),
+        "quotes": {
+            "symbols": list(quotes.symbols),
+            "bid": quotes.bid[:rows],
+            "ask": quotes.ask[:rows],
+            "spread": quotes.spread[:rows],
+            "timestamp": quotes.timestamp[:rows],
+        },
+        "candles": candles,
+        "last_candle_times": dict(xtb.last_candle_times),
+    }
+
+
+def dumps(xtb, candle_window: Optional[int] = 1000) -> bytes:
+    # pickled straight away, so the state cannot change while it is written
+    return pickle.dumps(capture(xtb, candle_window), pickle.HIGHEST_PROTOCOL)
+
+
+def write(path: str, data: bytes, compresslevel: int = 6):
+    # a crash mid-write leaves the previous snapshot in place
+    temporary = path + ".tmp"
+    with gzip.open(temporary, "wb", compresslevel=compresslevel) as file:
+        file.write(data)
+    os.replace(temporary, path)
+
+
+def read(path: str) -> Optional[dict]:
+    # snapshots are pickles, so only read files this application wrote
+    if not os.path.exists(path):
+        return None
+    with gzip.open(path, "rb") as file:
+        state = pickle.load(file)
+    if state.get("version") != SNAPSHOT_VERSION:
+        raise Exception(f"Unsupported snapshot version: {state.get('version')}")
+    return state
+
+
+def apply(xtb, state: dict):
+    # restored quotes and positions are stale until the streams and the
+    # reconciliation after login catch up
+    elapsed = max(0.0, time.time() - state["time"])
+
+    if xtb.account_currency is None:
+        xtb.account_currency = state["account_currency"]
+
+    for trade in state["positions"]:
+        xtb.positions.update(trade)
+    xtb.positions.margin, xtb.positions.equity = state["account"]
+
+    xtb.symbol_cache.restore(state["symbols"], elapsed)
+
+    quotes = state["quotes"]
+    for symbol, bid, ask, spread, timestamp in zip(
+        quotes["symbols"],
+        quotes["bid"],
+        quotes["ask"],
+        quotes["spread"],
+        quotes["timestamp"],
+    ):
+        if symbol not in xtb.quotes:
+            xtb.quotes.update(
+                symbol, float(bid), float(ask), int(timestamp), float(spread)
+            )
+
+    for symbol, period, columns in state["candles"]:
+        series = CandleSeries.from_columns(symbol, period, **columns)
+        series.max_length = xtb.max_streamed_candles
+        xtb.candle_series[(symbol, period)] = series
+
+    for symbol, ctm in state["last_candle_times"].items():
+        xtb.last_candle_times[symbol] = max(ctm, xtb.last_candle_times.get(symbol, 0))
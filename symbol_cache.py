@@ -0,0 +1,134 @@
+import time
+from collections import OrderedDict
+from typing import Iterable, List, Optional
+
+from commands.request import SymbolRecord
+
+# which SymbolRecord fields belong to which TTL class
+FIELD_CLASSES = {
+    "spec": (
+        "symbol",
+        "contractSize",
+        "currency",
+        "currencyProfit",
+        "leverage",
+        "marginMode",
+        "lot_min",
+        "lot_max",
+        "lot_step",
+    ),
+    "quote": ("ask", "bid"),
+}
+
+DEFAULT_TTLS = {
+    "spec": 24 * 60 * 60,
+    # quotes are never served from the cache unless asked for explicitly
+    "quote": 0,
+}
+
+
+class SymbolCache:
+    def __init__(self, max_size: int = 2000, ttls: Optional[dict] = None):
+        self.max_size = max_size
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+
+        # symbol -> [record, {field class: time stored}]
+        self.entries: OrderedDict[str, list] = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __fresh(self, entry: list, field_class: str, now: float) -> bool:
+        stored_at = entry[1].get(field_class)
+        return stored_at is not None and now - stored_at < self.ttls[field_class]
+
+    def get(self, symbol: str, field_class: str = "spec") -> Optional[SymbolRecord]:
+        if field_class not in FIELD_CLASSES:
+            raise Exception(f"Unknown field class: {field_class}")
+
+        entry = self.entries.get(symbol)
+        if entry is None or not self.__fresh(entry, field_class, time.monotonic()):
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(symbol)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, record: SymbolRecord):
+        self.__store(record, time.monotonic())
+        self.__trim()
+
+    def __store(self, record: SymbolRecord, now: float):
+        self.entries[record.symbol] = [record, {name: now for name in FIELD_CLASSES}]
+        self.entries.move_to_end(record.symbol)
+
+    def __trim(self):
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def preload(self, records: Iterable[SymbolRecord]):
+        # a bulk load is the whole instrument list; the cache grows to hold
+        # it rather than evicting most of what was just loaded
+        now = time.monotonic()
+        for record in records:
+            self.__store(record, now)
+        self.max_size = max(self.max_size, len(self.entries))
+
+    def export(self) -> List[tuple]:
+        # (record, {field class: age in seconds}) per entry, least recently
+        # used first; monotonic times do not survive a restart, ages do
+        now = time.monotonic()
+        return [
+            (record, {name: now - stored for name, stored in stored_at.items()})
+            for record, stored_at in self.entries.values()
+        ]
+
+    def restore(self, entries: Iterable[tuple], elapsed: float = 0):
+        # entries from export, taken elapsed seconds ago; fields keep ageing
+        # from when they were stored, so expired ones are still refetched
+        now = time.monotonic()
+        for record, ages in entries:
+            self.entries[record.symbol] = [
+                record,
+                {name: now - age - elapsed for name, age in ages.items()},
+            ]
+            self.entries.move_to_end(record.symbol)
+        self.max_size = max(self.max_size, len(self.entries))
+
+    def update_quote(self, symbol: str, ask: float, bid: float):
+        entry = self.entries.get(symbol)
+        if entry is None:
+            return
+        entry[0].ask = ask
+        entry[0].bid = bid
+        entry[1]["quote"] = time.monotonic()
+
+    def invalidate(
+        self, symbol: Optional[str] = None, field_class: Optional[str] = None
+    ):
+        symbols = list(self.entries) if symbol is None else [symbol]
+        for name in symbols:
+            entry = self.entries.get(name)
+            if entry is None:
+                continue
+            if field_class is None:
+                del self.entries[name]
+            else:
+                entry[1].pop(field_class, None)
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,125 @@
+import asyncio
+import time
+
+import numpy as np
+
+from candle_cache import CandleCache
+from candles import MINUTE, CandleSeries
+from download import CandleDownloader
+from mock_server import MockXTBServer
+from xtbapi import XTB
+
+
+def series(first: int, last: int) -> CandleSeries:
+    # one bar per minute from minute first up to, not including, last
+    ctm = np.arange(first, last, dtype=np.int64) * MINUTE
+    prices = np.ones(len(ctm))
+    return CandleSeries.from_columns(
+        "EURUSD",
+        1,
+        ctm=ctm,
+        open=prices,
+        high=prices,
+        low=prices,
+        close=prices,
+        vol=prices,
+    )
+
+
+def test_disjoint_store_replaces_the_block(tmp_path):
+    cache = CandleCache(str(tmp_path))
+    cache.store(series(0, 100))
+    cache.store(series(1000, 1100))
+
+    loaded = cache.load("EURUSD", 1)
+    assert len(loaded) == 100
+    assert loaded.ctm[0] == 1000 * MINUTE
+    assert cache.missing_ranges("EURUSD", 1, 0, 1100 * MINUTE) == [(0, 1000 * MINUTE)]
+
+
+def test_touching_ranges_merge(tmp_path):
+    cache = CandleCache(str(tmp_path))
+    cache.store(series(100, 200))
+    # the fetched range reaches the block even though its bars stop short,
+    # as they do before a weekend
+    cache.store(series(0, 50), 0, 100 * MINUTE)
+    cache.store(series(199, 300))
+
+    loaded = cache.load("EURUSD", 1)
+    assert len(loaded) == 250
+    assert cache.coverage("EURUSD", 1) == (0, 300 * MINUTE)
+    assert cache.missing_ranges("EURUSD", 1, 0, 300 * MINUTE) == []
+
+
+def test_missing_ranges_past_the_block(tmp_path):
+    cache = CandleCache(str(tmp_path))
+    cache.store(series(0, 10))
+    # the tail is fetched from the last cached bar, not from start
+    assert cache.missing_ranges("EURUSD", 1, 100 * MINUTE, 110 * MINUTE) == [
+        (9 * MINUTE, 110 * MINUTE)
+    ]
+
+
+def test_download_to_cache_keeps_one_block(tmp_path):
+    async def main():
+        async with MockXTBServer() as server:
+            xtb = XTB(health_check_interval=None)
+            server.attach(xtb)
+            await xtb.login("user", "password")
+
+            cache = CandleCache(str(tmp_path))
+            cache.store(series(10_000, 10_100))
+            downloader = CandleDownloader(xtb, chunk_bars=300)
+            # past the cached block, then before it
+            await downloader.download_to_cache(
+                cache, "EURUSD", 1, 11_000 * MINUTE, 11_100 * MINUTE
+            )
+            await downloader.download_to_cache(
+                cache, "EURUSD", 1, 9_000 * MINUTE, 10_000 * MINUTE
+            )
+
+            await xtb.disconnect()
+
+        loaded = cache.load("EURUSD", 1)
+        assert loaded.ctm[0] == 9_000 * MINUTE
+        assert loaded.ctm[-1] == 11_099 * MINUTE
+        assert (np.diff(loaded.ctm) == MINUTE).all()
+
+    asyncio.run(main())
+
+
+def test_head_without_history_is_fetched_once(tmp_path):
+    async def main():
+        async with MockXTBServer() as server:
+            now = int(time.time()) // 60 * 60_000
+            # the server keeps half an hour of minute bars
+            earliest = now - 30 * MINUTE
+            chart = server.handlers["getChartRangeRequest"]
+            heads = []
+
+            def capped(arguments):
+                info = arguments["info"]
+                heads.append((info["start"], info.get("end")))
+                info["start"] = max(info["start"], earliest)
+                return chart(arguments)
+
+            server.handle("getChartLastRequest", capped)
+            server.handle("getChartRangeRequest", capped)
+
+            xtb = XTB(
+                health_check_interval=None, candle_cache=CandleCache(str(tmp_path))
+            )
+            server.attach(xtb)
+            await xtb.login("user", "password")
+
+            await xtb.getCandles("EURUSD", 1, now - 20 * MINUTE)
+            for _ in range(2):
+                loaded = await xtb.getCandles("EURUSD", 1, now - 60 * MINUTE)
+                assert loaded.ctm[0] == earliest
+
+            await xtb.disconnect()
+
+        ranges = [request for request in heads if request[1] is not None]
+        assert ranges == [(now - 60 * MINUTE, now - 20 * MINUTE)]
+
+    asyncio.run(main())
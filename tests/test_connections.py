@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+
+from mock_server import MockXTBServer
+from xtbapi import XTB
+
+
+async def wait_until(condition, timeout: float = 2):
+    # polls, so a regression fails the test instead of hanging it
+    async def poll():
+        while not condition():
+            await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(poll(), timeout)
+
+
+def test_failed_pool_login_closes_opened_connections():
+    async def main():
+        async with MockXTBServer() as server:
+            login = server.handlers["login"]
+            logins = []
+
+            def reject_third(arguments):
+                logins.append(arguments)
+                if len(logins) == 3:
+                    raise Exception("Invalid login")
+                return login(arguments)
+
+            server.handle("login", reject_third)
+
+            xtb = XTB(health_check_interval=None, pool_size=3)
+            server.attach(xtb)
+            with pytest.raises(Exception, match="Login failed"):
+                await xtb.login("user", "password")
+
+            assert xtb.connections == []
+            await wait_until(lambda: not server.request_clients)
+
+    asyncio.run(main())
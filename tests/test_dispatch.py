@@ -0,0 +1,70 @@
+import asyncio
+
+from dispatch import BLOCK, Dispatcher
+
+
+def test_unsubscribe_wakes_blocked_publisher():
+    async def main():
+        dispatcher = Dispatcher()
+        release = asyncio.Event()
+        profits = []
+
+        async def slow(item):
+            await release.wait()
+
+        async def profit(item):
+            profits.append(item)
+
+        candles = dispatcher.subscribe(("candle", "EURUSD"), slow, maxsize=2)
+        dispatcher.subscribe("profit", profit)
+
+        # one item is taken by the stuck handler, two fill the queue
+        for i in range(3):
+            await dispatcher.publish(("candle", "EURUSD"), i)
+        await asyncio.sleep(0)
+        assert len(candles.queue) == 2
+        assert candles.queue.policy == BLOCK
+
+        publish = asyncio.create_task(dispatcher.publish(("candle", "EURUSD"), 3))
+        await asyncio.sleep(0.01)
+        assert not publish.done()
+
+        dispatcher.unsubscribe(("candle", "EURUSD"), candles)
+        await asyncio.wait_for(publish, 1)
+
+        await dispatcher.publish("profit", "p")
+        await asyncio.wait_for(dispatcher.join(), 1)
+        assert profits == ["p"]
+        dispatcher.stop()
+
+    asyncio.run(main())
+
+
+def test_publish_reaches_remaining_subscribers_after_unsubscribe():
+    async def main():
+        dispatcher = Dispatcher()
+        release = asyncio.Event()
+        received = []
+
+        async def slow(item):
+            await release.wait()
+
+        async def fast(item):
+            received.append(item)
+
+        first = dispatcher.subscribe("trade", slow, maxsize=1)
+        dispatcher.subscribe("trade", fast)
+        for i in range(2):
+            await dispatcher.publish("trade", i)
+        await asyncio.sleep(0)
+
+        publish = asyncio.create_task(dispatcher.publish("trade", 2))
+        await asyncio.sleep(0.01)
+        dispatcher.unsubscribe("trade", first)
+        await asyncio.wait_for(publish, 1)
+        await asyncio.wait_for(dispatcher.join(), 1)
+
+        assert received == [0, 1, 2]
+        dispatcher.stop()
+
+    asyncio.run(main())
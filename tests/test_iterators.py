@@ -0,0 +1,56 @@
+import asyncio
+
+from mock_server import MockXTBServer, synthetic_candles, synthetic_profits
+from xtbapi import XTB
+
+
+async def wait_until(condition, timeout: float = 1):
+    # polls, so a regression fails the test instead of hanging it
+    async def poll():
+        while not condition():
+            await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(poll(), timeout)
+
+
+def test_break_from_full_iterator_keeps_dispatch_running():
+    async def main():
+        async with MockXTBServer() as server:
+            xtb = XTB(health_check_interval=None)
+            server.attach(xtb)
+            await xtb.login("user", "password")
+
+            profits = []
+
+            async def on_profit(record):
+                profits.append(record)
+
+            await xtb.startProfitStream(on_profit)
+
+            leave = asyncio.Event()
+            received = []
+
+            async def consume():
+                # a blocking queue of two that the consumer stops draining
+                async for candle in xtb.candles("EURUSD", maxsize=2):
+                    received.append(candle)
+                    await leave.wait()
+                    break
+
+            consumer = asyncio.create_task(consume())
+            await server.wait_subscribed("candle", "EURUSD")
+            await server.replay(synthetic_candles("EURUSD", 10))
+            candles = xtb.dispatcher.subscribers[("candle", "EURUSD")][0]
+            await wait_until(lambda: len(candles.queue) == 2)
+
+            leave.set()
+            await asyncio.wait_for(consumer, 1)
+            assert len(received) == 1
+
+            await server.wait_subscribed("profit")
+            await server.replay(synthetic_profits(3))
+            await wait_until(lambda: len(profits) == 3)
+
+            await xtb.disconnect()
+
+    asyncio.run(main())
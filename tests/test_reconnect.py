@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+from mock_server import MockXTBServer, synthetic_candles, trade_data
+from xtbapi import XTB
+
+
+async def wait_until(condition, timeout: float = 2):
+    # polls, so a regression fails the test instead of hanging it
+    async def poll():
+        while not condition():
+            await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(poll(), timeout)
+
+
+def test_reconnect_resubscribes_backfills_and_reconciles():
+    async def main():
+        async with MockXTBServer() as server:
+            chart = server.handlers["getChartLastRequest"]
+
+            def chart_without_gbpusd(arguments):
+                if arguments["info"]["symbol"] == "GBPUSD":
+                    raise Exception("No history")
+                return chart(arguments)
+
+            server.handle("getChartLastRequest", chart_without_gbpusd)
+
+            xtb = XTB(health_check_interval=None)
+            server.attach(xtb)
+            await xtb.login("user", "password")
+
+            candles = []
+
+            async def on_candle(candle):
+                candles.append(candle)
+
+            async def ignore(candle):
+                pass
+
+            await xtb.startCandleStream("EURUSD", on_candle)
+            xtb.candle_callbacks["GBPUSD"] = ignore
+            await server.wait_subscribed("candle", "EURUSD")
+
+            # the last bar seen before the outage is ten minutes old
+            start = int(time.time()) // 60 * 60_000 - 11 * 60_000
+            await server.replay(synthetic_candles("EURUSD", 1, start))
+            await wait_until(lambda: len(candles) == 1)
+            last_seen = candles[0].ctm
+
+            # a position opened while the client was away
+            server.handle(
+                "getTrades",
+                lambda arguments: [
+                    dict(trade_data("EURUSD", 0, 0.1, 7, 7), open_price=1.1)
+                ],
+            )
+            await server.disconnect()
+            await wait_until(lambda: xtb.reconnect_count == 1)
+
+            assert not xtb.reconnecting
+            assert server.subscribers("trade") == 1
+            assert server.subscribers("candle", "EURUSD") == 1
+            assert server.subscribers("candle", "GBPUSD") == 1
+
+            await wait_until(lambda: len(candles) > 1)
+            assert all(candle.ctm > last_seen for candle in candles[1:])
+            assert 7 in xtb.positions
+
+            await xtb.disconnect()
+
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+class BatchResult(dict):
+    def __init__(self):
+        super().__init__()
+        self.errors: dict = {}
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def __repr__(self):
+        return f"BatchResult({dict.__repr__(self)}, errors={self.errors!r})"
+
+
+class OrderLeg:
+    def __init__(self, symbol: str, operation, volume: float):
+        self.symbol = symbol
+        self.operation = operation
+        self.volume = volume
+
+    def __repr__(self):
+        return f"OrderLeg({self.symbol}, {self.operation}, {self.volume})"
+
+
+FILLED = "filled"
+REJECTED = "rejected"
+TIMED_OUT = "timeout"
+
+
+class LegResult:
+    def __init__(self, **kwargs):
+        self.leg: OrderLeg = kwargs.get("leg")
+        self.status: str = kwargs.get("status")
+        self.order = kwargs.get("order")
+        self.position = kwargs.get("position")
+        self.error = kwargs.get("error")
+        # seconds from the start of the basket
+        self.ack_latency = kwargs.get("ack_latency")
+        self.fill_latency = kwargs.get("fill_latency")
+
+    @property
+    def filled(self) -> bool:
+        return self.status == FILLED
+
+    def __repr__(self):
+        return f"LegResult({self.leg}, {self.status}, order={self.order}, ack_latency={self.ack_latency}, fill_latency={self.fill_latency}, error={self.error!r})"
+
+
+class BasketResult:
+    def __init__(self, legs: list, elapsed: float):
+        self.legs = legs
+        self.elapsed = elapsed
+
+    @property
+    def filled(self) -> list:
+        return [leg for leg in self.legs if leg.filled]
+
+    @property
+    def failed(self) -> list:
+        return [leg for leg in self.legs if not leg.filled]
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
+    def __repr__(self):
+        return f"BasketResult(filled={len(self.filled)}, failed={len(self.failed)}, elapsed={self.elapsed:.3f})"
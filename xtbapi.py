@@ -2,13 +2,36 @@ import asyncio
 import datetime
 import math
 import time
-from typing import List, Optional
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
 import websockets
 from websockets.client import WebSocketClientProtocol
-import json
 
+import codec
+import snapshot
+from candle_cache import CandleCache
+from candles import CandleSeries
 from commands.request import *
 from commands.streaming import *
+from conflation import LatestValues
+from connection import RequestConnection
+from dispatch import Dispatcher, Subscriber
+from keepalive import LinkMonitor
+from margin import MarginCalculator
+from metrics import Metrics
+from positions import PositionBook
+from quotes import Quote, QuoteBook
+from recording import STREAM, SessionRecorder
+from symbol_cache import SymbolCache
+from xtb_types import (
+    FILLED,
+    REJECTED,
+    TIMED_OUT,
+    BasketResult,
+    BatchResult,
+    LegResult,
+    OrderLeg,
+)
 
 XTB_LIVE_WEBSOCKET_URL = "wss://ws.xtb.com"
 XTB_LIVE_STREAMING_URL = "wss://ws.xtb.com/stream"
@@ -16,6 +39,20 @@ XTB_LIVE_STREAMING_URL = "wss://ws.xtb.com/stream"
 XTB_DEMO_WEBSOCKET_URL = "wss://ws.xtb.com/demo"
 XTB_DEMO_STREAMING_URL = "wss://ws.xtb.com/demoStream"
 
+MAX_EARLY_FILLS = 1000
+
+# what a conflating subscriber keeps one pending update per
+CONFLATION_KEYS = {
+    "trade": lambda record: record.position,
+    "balance": lambda record: None,
+    "profit": lambda record: record.position,
+    "candle": lambda record: record.symbol,
+    "tickPrices": lambda record: record.symbol,
+}
+
+# streams that are also published per symbol, as (command, symbol)
+SYMBOL_STREAMS = ("candle", "tickPrices")
+
 
 class ClosedPosition:
     def __init__(self, **kwargs):
@@ -40,12 +77,18 @@ class XTBPosition:
         self.volume = kwargs.get("volume")
         self.openPrice = kwargs.get("openPrice")
         self.openTime = kwargs.get("openTime")
+        self.last_profit = kwargs.get("profit")
 
     @property
     def profit(self):
-        return self.xtb.positions[self.id].profit
+        # closed positions leave the book, so fall back to the last value seen
+        trade = self.xtb.positions.get(self.id)
+        if trade is not None:
+            self.last_profit = trade.profit
+        return self.last_profit
 
     async def close(self):
+        profit = self.profit
         await self.xtb.close(self.id, volume=self.volume)
         return ClosedPosition(
             id=self.id,
@@ -55,7 +98,7 @@ class XTBPosition:
             openTime=self.openTime,
             closePrice=self.openPrice,
             closeTime=datetime.datetime.now(),
-            profit=self.profit,
+            profit=profit,
         )
 
     def __repr__(self):
@@ -66,6 +109,24 @@ class XTB:
     def __init__(
         self,
         real: bool = False,
+        request_rate: float = 5,
+        request_burst: int = 5,
+        trade_rate: float = 5,
+        trade_burst: int = 5,
+        pool_size: int = 1,
+        health_check_interval: Optional[float] = 30,
+        reconnect: bool = True,
+        max_reconnect_delay: float = 60,
+        max_streamed_candles: Optional[int] = 100_000,
+        candle_cache: Optional[CandleCache] = None,
+        bulk_symbol_threshold: int = 20,
+        symbol_cache: Optional[SymbolCache] = None,
+        message_queue_size: int = 10_000,
+        metrics: Optional[Metrics] = None,
+        link_monitor: Optional[LinkMonitor] = None,
+        snapshot_path: Optional[str] = None,
+        snapshot_interval: Optional[float] = 60,
+        snapshot_candles: Optional[int] = 1000,
     ):
         self.websocket_url: str = (
             XTB_LIVE_WEBSOCKET_URL if real else XTB_DEMO_WEBSOCKET_URL
@@ -73,48 +134,365 @@ class XTB:
         self.streaming_url: str = (
             XTB_LIVE_STREAMING_URL if real else XTB_DEMO_STREAMING_URL
         )
-        self.websocket: Optional[WebSocketClientProtocol] = None
+        self.connections: List[RequestConnection] = []
         self.streaming_websocket: Optional[WebSocketClientProtocol] = None
         self.stream_session_id: Optional[str] = None
-        self.message_queue = asyncio.Queue()
+        self.message_queue = asyncio.Queue(maxsize=message_queue_size)
+        self.dispatcher = Dispatcher()
+        self.callback_subscribers: dict = {}
+        self.conflated: dict[str, LatestValues] = {}
+        self.recorder: Optional[SessionRecorder] = None
+
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.metrics.add_collector(self.__collectMetrics)
 
         self.stopped: bool = False
+        self.tasks: List[asyncio.Task] = []
 
         self.balance_callback = None
         self.trade_callback = None
         self.profit_callback = None
         self.candle_callbacks = {}
-
-        self.positions: dict[int, XTBPosition] = {}
+        # symbol -> number of open candle iterators
+        self.candle_consumers: dict[str, int] = {}
+        self.disconnect_callback = None
+        self.reconnect_callback = None
+        self.link_warning_callback = None
+        self.last_candle_times: dict[str, int] = {}
+        self.candle_series: dict[tuple[str, int], CandleSeries] = {}
+        self.max_streamed_candles = max_streamed_candles
+        self.candle_cache = candle_cache
+        self.bulk_symbol_threshold = bulk_symbol_threshold
+        self.symbol_cache = symbol_cache if symbol_cache is not None else SymbolCache()
+
+        self.positions = PositionBook()
+        self.quotes = QuoteBook()
+        self.account_currency: Optional[str] = None
+        # symbol -> getTickPrices arguments, renewed on reconnect
+        self.tick_subscriptions: dict[str, dict] = {}
         self.position_futures: dict[int, asyncio.Future] = {}
+        self.early_fills: OrderedDict[int, XTBPosition] = OrderedDict()
+
+        if pool_size < 1:
+            raise Exception("Pool size must be at least 1")
+        self.pool_size = pool_size
+        # request connections and the streaming socket are pinged at this
+        # interval, which also keeps idle sessions open
+        self.health_check_interval = health_check_interval
+        self.link = link_monitor if link_monitor is not None else LinkMonitor()
+        self.connection_limits = {
+            "request_rate": request_rate,
+            "request_burst": request_burst,
+            "trade_rate": trade_rate,
+            "trade_burst": trade_burst,
+        }
+        self.__credentials = None
+
+        self.reconnect = reconnect
+        self.max_reconnect_delay = max_reconnect_delay
+        self.reconnecting: bool = False
+        self.reconnect_count = 0
 
-        self.last_request_action_time = 0
         self.last_streaming_action_time = 0
 
-    async def login(self, userId: str, password: str):
-        if self.websocket:
-            raise Exception("Already logged in")
-
-        self.websocket = await websockets.connect(self.websocket_url)
+        # with a path, the local state is written there periodically and on
+        # disconnect; snapshot_candles bars are kept of each candle series
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_candles = snapshot_candles
+        self.snapshot_restored: bool = False
 
-        login_command = LoginCommand(userId, password)
-        await self.websocket.send(login_command.serialize())
+    @property
+    def websocket(self) -> Optional[WebSocketClientProtocol]:
+        return self.connections[0].websocket if self.connections else None
 
-        response = await self.websocket.recv()
-        response = json.loads(response)
+    async def __openConnection(self) -> RequestConnection:
+        connection = RequestConnection(
+            self.websocket_url, **self.connection_limits, metrics=self.metrics
+        )
+        connection.recorder = self.recorder
+        await connection.login(*self.__credentials)
+        return connection
 
-        if not response["status"]:
-            raise Exception("Login failed")
+    async def login(self, userId: str, password: str):
+        if self.connections:
+            raise Exception("Already logged in")
 
-        self.stream_session_id = response["streamSessionId"]
+        self.__credentials = (userId, password)
+        self.stopped = False
+        opened = await asyncio.gather(
+            *[self.__openConnection() for _ in range(self.pool_size)],
+            return_exceptions=True,
+        )
+        failed = [result for result in opened if isinstance(result, Exception)]
+        if failed:
+            # the connections that did log in would otherwise stay open
+            for connection in opened:
+                if not isinstance(connection, Exception):
+                    await connection.close()
+            raise failed[0]
+        self.connections = list(opened)
+
+        # every pooled connection gets its own stream session, but streaming
+        # is shared, so only the first one is used
+        self.stream_session_id = self.connections[0].stream_session_id
         self.streaming_websocket = await websockets.connect(self.streaming_url)
+        await self.__subscribe()
+        if self.snapshot_restored:
+            await self.__reconcileSnapshot()
+
+        self.tasks = [asyncio.create_task(self.__handleStreamingMessages())]
+        self.startDispatch()
+        if self.health_check_interval:
+            self.tasks.append(asyncio.create_task(self.__checkConnections()))
+        if self.snapshot_path and self.snapshot_interval:
+            self.tasks.append(asyncio.create_task(self.__writeSnapshots()))
+
+    async def disconnect(self):
+        self.stopped = True
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+
+        self.dispatcher.stop()
+        self.callback_subscribers = {}
+        for latest in self.conflated.values():
+            latest.close()
+
+        if self.streaming_websocket:
+            await self.streaming_websocket.close()
+        for connection in self.connections:
+            await connection.close()
+        self.connections = []
+        self.stopRecording()
+
+        if self.snapshot_path:
+            try:
+                await self.saveSnapshot()
+            except Exception as e:
+                print(f"Snapshot failed: {e!r}")
 
+    async def __subscribe(self):
         await self.__doStreamingCommand(getTradesStreamCommand)
         await self.__doStreamingCommand(getBalanceStreamCommand)
         await self.__doStreamingCommand(getProfitStreamCommand)
+        await self.__doStreamingCommand(getKeepAliveStreamCommand)
+
+        for symbol in self.__candleSymbols():
+            await self.__doStreamingCommand(getCandlesStreamCommand(symbol=symbol))
+        for symbol, arguments in self.tick_subscriptions.items():
+            await self.__doStreamingCommand(
+                getTickPricesStreamCommand(symbol=symbol, **arguments)
+            )
+
+    async def __reconnect(self):
+        self.reconnecting = True
+        if self.disconnect_callback:
+            await self.disconnect_callback()
 
-        asyncio.create_task(self.__handleStreamingMessages())
-        asyncio.create_task(self.__handleMessageQueue())
+        delay = 1
+        while not self.stopped:
+            for connection in self.connections:
+                await connection.close()
+            self.connections = []
+
+            try:
+                opened = await asyncio.gather(
+                    *[self.__openConnection() for _ in range(self.pool_size)],
+                    return_exceptions=True,
+                )
+                # the ones that did open are closed on the next attempt
+                self.connections = [c for c in opened if not isinstance(c, Exception)]
+                for result in opened:
+                    if isinstance(result, Exception):
+                        raise result
+                self.stream_session_id = self.connections[0].stream_session_id
+                self.streaming_websocket = await websockets.connect(self.streaming_url)
+                await self.__subscribe()
+                break
+            except Exception as e:
+                # a streaming socket opened before the failure would leak
+                if self.streaming_websocket:
+                    await self.streaming_websocket.close()
+                print(f"Reconnect failed: {e}, retrying in {delay}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+
+        if not self.stopped:
+            await self.__resync()
+
+        self.reconnecting = False
+        self.reconnect_count += 1
+        self.metrics.inc("xtb_reconnects_total")
+        if self.reconnect_callback:
+            await self.reconnect_callback()
+
+    async def __resync(self):
+        # catch up on what the outage missed. Streams are already subscribed
+        # but not read yet, so streamed bars the backfill also returns are
+        # dropped as duplicates and trade updates land on the refreshed book.
+        # Failures are logged and never fail the reconnect
+        results = await asyncio.gather(
+            self.__backfillCandles(),
+            self.getTrades(opened_only=True),
+            return_exceptions=True,
+        )
+        trades = results[1]
+        if isinstance(trades, Exception):
+            print(f"Position reconcile failed: {trades!r}")
+        else:
+            self.positions.reconcile(trades, refresh=True)
+
+    async def __backfillCandles(self):
+        symbols = list(self.__candleSymbols())
+        results = await asyncio.gather(
+            *[self.__backfillSymbol(symbol) for symbol in symbols],
+            return_exceptions=True,
+        )
+        for symbol, result in zip(symbols, results):
+            if isinstance(result, Exception):
+                print(f"Candle backfill for {symbol} failed: {result!r}")
+
+    async def __backfillSymbol(self, symbol: str):
+        last_time = self.last_candle_times.get(symbol)
+        data = await self.__doCommand(
+            GetChartLastRequestCommand(
+                symbol=symbol,
+                period=1,
+                start=last_time or math.floor(time.time() * 1000),
+            )
+        )
+        if last_time is None:
+            return
+
+        for rate_info in data["rateInfos"]:
+            if rate_info["ctm"] <= last_time:
+                continue
+            candle = Candle.from_wire(
+                rate_info_to_candle(rate_info, symbol, data["digits"])
+            )
+            self.__storeCandle(candle)
+            await self.message_queue.put(("candle", candle, time.monotonic()))
+
+    def restoreSnapshot(self, path: Optional[str] = None) -> bool:
+        # call before login, which then reconciles the restored state with
+        # the server; False when there is no snapshot to restore
+        path = path or self.snapshot_path
+        if path is None:
+            raise Exception("No snapshot path")
+        if self.connections:
+            raise Exception("Cannot restore a snapshot while logged in")
+
+        state = snapshot.read(path)
+        if state is None:
+            return False
+        snapshot.apply(self, state)
+        self.snapshot_restored = True
+        return True
+
+    async def saveSnapshot(self, path: Optional[str] = None):
+        path = path or self.snapshot_path
+        if path is None:
+            raise Exception("No snapshot path")
+        data = snapshot.dumps(self, self.snapshot_candles)
+        # compressing and writing stay off the event loop
+        await asyncio.get_running_loop().run_in_executor(
+            None, snapshot.write, path, data
+        )
+
+    async def __writeSnapshots(self):
+        while not self.stopped:
+            await asyncio.sleep(self.snapshot_interval)
+            try:
+                await self.saveSnapshot()
+            except Exception as e:
+                print(f"Snapshot failed: {e!r}")
+
+    async def __reconcileSnapshot(self):
+        # one getTrades and one chart request per restored candle series;
+        # stream messages are not handled yet, so streamed bars and trade
+        # updates are applied on top of the reconciled state
+        self.snapshot_restored = False
+        self.positions.reconcile(await self.getTrades(opened_only=True), refresh=True)
+
+        restored = [key for key, series in self.candle_series.items() if len(series)]
+        results = await asyncio.gather(
+            *[
+                self.fetchCandles(
+                    symbol, period, int(self.candle_series[(symbol, period)].ctm[-1])
+                )
+                for symbol, period in restored
+            ],
+            return_exceptions=True,
+        )
+        for (symbol, period), fresh in zip(restored, results):
+            if isinstance(fresh, Exception):
+                print(f"Candle backfill for {symbol} failed: {fresh!r}")
+                continue
+            series = self.candle_series[(symbol, period)]
+            series.extend(**fresh.columns())
+            if period == 1:
+                self.last_candle_times[symbol] = max(
+                    self.last_candle_times.get(symbol, 0), int(series.ctm[-1])
+                )
+
+    async def __checkConnections(self):
+        while not self.stopped:
+            await asyncio.sleep(self.health_check_interval)
+            if self.reconnecting:
+                continue
+
+            for connection in list(self.connections):
+                rtt = None if connection.closed else await connection.ping()
+                if rtt is not None:
+                    self.link.record_rtt(rtt)
+                    continue
+
+                if connection not in self.connections:
+                    continue
+                print("Replacing dead connection")
+                self.metrics.inc("xtb_connection_replacements_total")
+                self.connections.remove(connection)
+                await connection.close()
+
+            # replacements that fail are retried on the next check
+            while len(self.connections) < self.pool_size and not self.stopped:
+                try:
+                    self.connections.append(await self.__openConnection())
+                except Exception as e:
+                    print(f"Reconnect failed: {e}")
+                    break
+
+            await self.__checkLink()
+
+    async def __checkLink(self):
+        try:
+            await self.__doStreamingCommand(pingStreamCommand)
+            if self.link.clock_due():
+                await self.syncClock()
+        except Exception as e:
+            print(f"Link check failed: {e!r}")
+
+        for kind, value in self.link.check():
+            print(f"Link warning: {kind} {value:.3f}s")
+            if self.link_warning_callback:
+                await self.link_warning_callback(kind, value)
+
+    async def syncClock(self) -> float:
+        # timed from when the request went out, not from when it was queued
+        response, sent_at, received_at = await self.__connection().timed(
+            GetServerTimeCommand()
+        )
+        if not response["status"]:
+            raise Exception("Command failed: " + response["errorDescr"])
+        server_time = ServerTime.from_wire(response["returnData"])
+        self.link.record_clock(sent_at, server_time.time, received_at)
+        return self.link.clock_offset
+
+    def serverTime(self, local: Optional[float] = None) -> int:
+        # local time.time() on the server clock in milliseconds, for
+        # timestamping streaming events
+        return self.link.server_time(local)
 
     async def __handleStreamingMessages(self):
         while not self.stopped:
@@ -123,97 +501,200 @@ class XTB:
                 # print(message)
             except websockets.exceptions.ConnectionClosed:
                 print("Connection closed")
-                break
-
-            message = json.loads(message)
-            if message["command"] == "trade":
-                trade = StreamingTradeRecord(**message["data"])
-                self.positions[trade.position] = trade
-
-                # print(trade)
-
-                if (
-                    trade.order2 != trade.order
-                    and trade.order2 in self.position_futures
-                ):
-                    position = XTBPosition(
-                        xtb=self,
-                        id=trade.order2,
-                        symbol=trade.symbol,
-                        volume=trade.volume,
-                        openPrice=trade.openPrice,
-                        openTime=trade.openTime,
-                        profit=trade.profit,
-                    )
-                    self.positions[trade.order2] = trade
-                    self.position_futures[trade.order2].set_result(position)
-
-            await self.message_queue.put(message)
+                if self.stopped or not self.reconnect:
+                    break
+                await self.__reconnect()
+                continue
+
+            self.link.stream_activity()
+            if self.recorder is not None:
+                self.recorder.write(STREAM, message)
+            await self.processStreamingMessage(message)
+
+    async def processStreamingMessage(self, message):
+        # decode one raw streaming message, update positions and candles and
+        # queue it for dispatch; replays feed recorded messages in here
+        received_at = time.perf_counter()
+        message = codec.loads(message)
+        command = message["command"]
+        record_class = streaming_record_classes.get(command)
+        if not record_class:
+            return
+        record = record_class.from_wire(message["data"])
+        self.metrics.observe(
+            "xtb_stream_decode_seconds",
+            time.perf_counter() - received_at,
+            command=command,
+        )
+        self.metrics.inc("xtb_stream_messages_total", command=command)
+
+        if command == "keepAlive":
+            # only there to show the stream is alive
+            return
+
+        if command == "trade":
+            trade = record
+            self.positions.update(trade)
+
+            # print(trade)
+
+            if trade.order2 != trade.order:
+                position = XTBPosition(
+                    xtb=self,
+                    id=trade.order2,
+                    symbol=trade.symbol,
+                    volume=trade.volume,
+                    openPrice=trade.openPrice,
+                    openTime=trade.openTime,
+                    profit=trade.profit,
+                )
+                future = self.position_futures.get(trade.order2)
+                if future is None:
+                    # with pipelined commands the fill can arrive before the
+                    # transaction response, keep it for the waiter
+                    self.early_fills[trade.order2] = position
+                    while len(self.early_fills) > MAX_EARLY_FILLS:
+                        self.early_fills.popitem(last=False)
+                elif not future.done():
+                    future.set_result(position)
+
+        elif command == "candle":
+            if record.ctm <= self.last_candle_times.get(record.symbol, 0):
+                return
+            self.__storeCandle(record)
+
+        elif command == "tickPrices":
+            # quotes are readable as soon as they are decoded, ahead of the
+            # dispatch queue
+            self.quotes.update_tick(record)
+            if not record.level:
+                self.symbol_cache.update_quote(record.symbol, record.ask, record.bid)
+
+        await self.message_queue.put((command, record, time.monotonic()))
+
+    def startDispatch(self) -> asyncio.Task:
+        # login starts this; replays without a connection start it themselves
+        task = asyncio.create_task(self.__handleMessageQueue())
+        self.tasks.append(task)
+        return task
 
     async def __handleMessageQueue(self):
         while not self.stopped:
-            message = await self.message_queue.get()
-            # print(message)
-
-            if message["command"] == "trade" and self.trade_callback:
-                await self.trade_callback(StreamingTradeRecord(**message["data"]))
-
-            elif message["command"] == "balance" and self.balance_callback:
-                await self.balance_callback(StreamingBalanceRecord(**message["data"]))
-
-            elif message["command"] == "profit":
-                record = StreamingProfitRecord(**message["data"])
-                if record.position in self.positions:
-                    self.positions[record.position].profit = record.profit
-                if self.profit_callback:
-                    await self.profit_callback(record)
-
-            elif (
-                message["command"] == "candle"
-                and message["data"]["symbol"] in self.candle_callbacks
-            ):
-                await self.candle_callbacks[message["data"]["symbol"]](
-                    Candle(**message["data"])
-                )
+            command, record, enqueued_at = await self.message_queue.get()
+            self.message_queue.task_done()
+            self.metrics.observe(
+                "xtb_message_queue_lag_seconds", time.monotonic() - enqueued_at
+            )
+
+            if command == "profit":
+                self.positions.update_profit(record.position, record.profit)
+            elif command == "balance":
+                self.positions.update_balance(record)
+
+            latest = self.conflated.get(command)
+            if latest is not None:
+                latest.update(record)
+
+            # handlers run in their own subscriber tasks, so a slow one only
+            # backs up its own queue
+            if command in SYMBOL_STREAMS:
+                await self.dispatcher.publish((command, record.symbol), record)
+            await self.dispatcher.publish(command, record)
+
+    def __setCallback(self, stream_key, callback, **options):
+        previous: Optional[Subscriber] = self.callback_subscribers.pop(stream_key, None)
+        if previous:
+            self.dispatcher.unsubscribe(stream_key, previous)
+        if not callback:
+            return
+
+        command = stream_key if isinstance(stream_key, str) else stream_key[0]
+        options.setdefault("key", CONFLATION_KEYS[command])
+        self.callback_subscribers[stream_key] = self.dispatcher.subscribe(
+            stream_key, callback, **options
+        )
+
+    def conflateStream(
+        self, stream: str, callback=None, interval: float = 0
+    ) -> LatestValues:
+        if stream not in CONFLATION_KEYS:
+            raise Exception(f"Cannot conflate stream: {stream}")
+
+        if stream not in self.conflated:
+            self.conflated[stream] = LatestValues(CONFLATION_KEYS[stream])
+        latest = self.conflated[stream]
+        if callback:
+            latest.subscribe(callback, interval)
+        return latest
+
+    def dispatchStats(self) -> dict:
+        return {
+            "message_queue": self.message_queue.qsize(),
+            "subscribers": self.dispatcher.stats(),
+        }
+
+    def __collectMetrics(self, metrics: Metrics):
+        metrics.set("xtb_message_queue_depth", self.message_queue.qsize())
+        for stats in self.dispatcher.stats():
+            name = stats["name"]
+            metrics.set("xtb_subscriber_queue_depth", stats["depth"], subscriber=name)
+            metrics.set("xtb_subscriber_dropped", stats["dropped"], subscriber=name)
+            metrics.set("xtb_subscriber_lag_seconds", stats["lag"], subscriber=name)
+
+        if self.link.rtt is not None:
+            metrics.set("xtb_link_rtt_seconds", self.link.rtt)
+        metrics.set("xtb_clock_offset_seconds", self.link.clock_offset)
+        staleness = self.link.staleness()
+        if staleness is not None:
+            metrics.set("xtb_stream_staleness_seconds", staleness)
+
+    def __storeCandle(self, candle: Candle):
+        self.last_candle_times[candle.symbol] = candle.ctm
+        self.candleSeries(candle.symbol).append_candle(candle)
+
+    async def __waitForTrade(self, position_id: int, timeout: Optional[float] = None):
+        if position_id in self.early_fills:
+            self.metrics.observe("xtb_order_fill_seconds", 0)
+            return self.early_fills.pop(position_id)
 
-    async def __waitForTrade(self, position_id: int):
         if position_id not in self.position_futures:
             self.position_futures[
                 position_id
             ] = asyncio.get_event_loop().create_future()
 
-        position = await self.position_futures[position_id]
-        del self.position_futures[position_id]
-        return position
+        waiting_since = time.monotonic()
+        try:
+            position = await asyncio.wait_for(
+                self.position_futures[position_id], timeout
+            )
+            self.metrics.observe(
+                "xtb_order_fill_seconds", time.monotonic() - waiting_since
+            )
+            return position
+        finally:
+            self.position_futures.pop(position_id, None)
 
-    async def __doCommand(self, command: BaseCommand, **kwargs):
-        if not self.websocket:
+    def __connection(self) -> RequestConnection:
+        connections = [c for c in self.connections if not c.closed]
+        if not connections:
             raise Exception("Not logged in")
+        return min(connections, key=lambda c: c.outstanding)
 
+    async def __doCommand(self, command: BaseCommand, **kwargs):
+        connection = self.__connection()
         if not isinstance(command, BaseCommand):
             command = command()
 
-        time_diff = time.time() - self.last_request_action_time
-        if time_diff < 0.2:
-            await asyncio.sleep(0.2 - time_diff)
-
-        cmd = command.serialize(**kwargs)
-        print(cmd)
-
-        await self.websocket.send(cmd)
-
-        response = await self.websocket.recv()
-        response = json.loads(response)
+        response = await connection.send(command, **kwargs)
 
         if not response["status"]:
             raise Exception("Command failed: " + response["errorDescr"])
 
         data = response["returnData"]
-        print(data)
 
         if command.result_class:
             if isinstance(data, dict):
-                return command.result_class(**data)
+                return command.result_class.from_wire(data)
             else:
                 return command.result_class(data)
         else:
@@ -231,23 +712,72 @@ class XTB:
 
         await self.streaming_websocket.send(ser)
 
+    def startRecording(self, path: str) -> SessionRecorder:
+        # raw streaming messages, commands and responses; logins are never
+        # recorded, so the log holds no credentials
+        if self.recorder is not None:
+            raise Exception("Already recording")
+        self.recorder = SessionRecorder(path)
+        for connection in self.connections:
+            connection.recorder = self.recorder
+        return self.recorder
+
+    def stopRecording(self):
+        if self.recorder is None:
+            return
+        for connection in self.connections:
+            connection.recorder = None
+        self.recorder.close()
+        self.recorder = None
+
+    def rateLimitStats(self) -> List[dict]:
+        return [connection.stats() for connection in self.connections]
+
     async def getMarginLevel(self) -> BalanceRecord:
         return await self.__doCommand(GetMarginLevelCommand)
 
-    async def getTrades(self, opened_only: bool = True) -> List[XTBPosition]:
+    async def getTrades(self, opened_only: bool = True) -> List[TradeRecord]:
         return await self.__doCommand(GetTradesCommand(opened_only=opened_only))
 
-    async def startBalanceStream(self, callback):
+    async def reconcilePositions(self) -> tuple:
+        return self.positions.reconcile(await self.getTrades(opened_only=True))
+
+    async def startBalanceStream(self, callback, **options):
         self.balance_callback = callback
+        self.__setCallback("balance", callback, **options)
 
-    async def startTradeStream(self, callback):
+    async def startTradeStream(self, callback, **options):
         self.trade_callback = callback
+        self.__setCallback("trade", callback, **options)
 
-    async def startProfitStream(self, callback):
+    async def startProfitStream(self, callback, **options):
         self.profit_callback = callback
+        self.__setCallback("profit", callback, **options)
 
-    async def startCandleStream(self, symbol: str, callback):
-        self.candle_callbacks[symbol] = callback
+    def setConnectionCallbacks(
+        self, on_disconnect=None, on_reconnect=None, on_link_warning=None
+    ):
+        self.disconnect_callback = on_disconnect
+        self.reconnect_callback = on_reconnect
+        # on_link_warning(kind, value) with kind "rtt" or "stale"
+        self.link_warning_callback = on_link_warning
+
+    def candleSeries(self, symbol: str, period: int = 1) -> CandleSeries:
+        key = (symbol, period)
+        if key not in self.candle_series:
+            self.candle_series[key] = CandleSeries(
+                symbol, period, max_length=self.max_streamed_candles
+            )
+        return self.candle_series[key]
+
+    def __candleSymbols(self) -> set:
+        return set(self.candle_callbacks) | set(self.candle_consumers)
+
+    async def __subscribeCandles(self, symbol: str):
+        self.candleSeries(symbol)
+        if not self.streaming_websocket:
+            # subscribed on login
+            return
         await self.__doCommand(
             GetChartLastRequestCommand(
                 symbol=symbol, period=1, start=math.floor(time.time() * 1000)
@@ -255,12 +785,156 @@ class XTB:
         )
         await self.__doStreamingCommand(getCandlesStreamCommand(symbol=symbol))
 
-    async def getCandles(self, symbol: str, period: int, start: int):
-        data = await self.__doCommand(
-            GetChartLastRequestCommand(symbol=symbol, period=period, start=start)
+    async def __unsubscribeCandles(self, symbol: str):
+        if symbol in self.__candleSymbols():
+            return
+        if self.stopped or not self.streaming_websocket:
+            return
+        try:
+            await self.__doStreamingCommand(stopCandlesStreamCommand(symbol=symbol))
+        except websockets.exceptions.ConnectionClosed:
+            # the subscription went with the socket
+            pass
+
+    async def startCandleStream(self, symbol: str, callback, **options):
+        subscribed = symbol in self.__candleSymbols()
+        self.candle_callbacks[symbol] = callback
+        self.__setCallback(("candle", symbol), callback, **options)
+        if not subscribed:
+            await self.__subscribeCandles(symbol)
+
+    async def stopCandleStream(self, symbol: str):
+        self.candle_callbacks.pop(symbol, None)
+        self.__setCallback(("candle", symbol), None)
+        await self.__unsubscribeCandles(symbol)
+
+    async def startTickStream(
+        self,
+        symbol: str,
+        callback=None,
+        min_arrival_time: int = 0,
+        max_level: int = 0,
+        **options,
+    ):
+        # min_arrival_time is the minimum gap in ms between ticks the server
+        # sends; prices land in self.quotes with or without a callback
+        self.__setCallback(("tickPrices", symbol), callback, **options)
+        arguments = {"minArrivalTime": min_arrival_time, "maxLevel": max_level}
+        if self.tick_subscriptions.get(symbol) == arguments:
+            return
+        self.tick_subscriptions[symbol] = arguments
+        if self.streaming_websocket:
+            await self.__doStreamingCommand(
+                getTickPricesStreamCommand(symbol=symbol, **arguments)
+            )
+
+    async def stopTickStream(self, symbol: str):
+        self.__setCallback(("tickPrices", symbol), None)
+        if self.tick_subscriptions.pop(symbol, None) is None:
+            return
+        if self.streaming_websocket and not self.stopped:
+            await self.__doStreamingCommand(stopTickPricesStreamCommand(symbol=symbol))
+
+    def getQuote(self, symbol: str) -> Optional[Quote]:
+        # the latest streamed quote, without a request
+        return self.quotes.quote(symbol)
+
+    async def waitForQuote(
+        self, symbol: Optional[str] = None, timeout: Optional[float] = None
+    ) -> Quote:
+        return await self.quotes.wait(symbol, timeout)
+
+    async def __nextItem(self, subscriber: Subscriber, batch: Optional[int]):
+        if batch:
+            return await subscriber.get_batch(batch)
+        return await subscriber.get()
+
+    async def addCandleSubscriber(self, symbol: str, handler, **options) -> Subscriber:
+        # a subscriber with its own queue next to the startCandleStream
+        # callback; without a handler it is read with get/get_batch. The
+        # stream is stopped when the last subscriber is removed
+        stream_key = ("candle", symbol)
+        options.setdefault("key", CONFLATION_KEYS["candle"])
+        subscriber = self.dispatcher.subscribe(stream_key, handler, **options)
+
+        subscribed = symbol in self.__candleSymbols()
+        self.candle_consumers[symbol] = self.candle_consumers.get(symbol, 0) + 1
+        if not subscribed:
+            try:
+                await self.__subscribeCandles(symbol)
+            except Exception:
+                await self.removeCandleSubscriber(symbol, subscriber)
+                raise
+        return subscriber
+
+    async def removeCandleSubscriber(self, symbol: str, subscriber: Subscriber):
+        self.dispatcher.unsubscribe(("candle", symbol), subscriber)
+        self.candle_consumers[symbol] -= 1
+        if not self.candle_consumers[symbol]:
+            del self.candle_consumers[symbol]
+        await self.__unsubscribeCandles(symbol)
+
+    async def candles(self, symbol: str, batch: Optional[int] = None, **options):
+        # async for candle in xtb.candles("EURUSD"), or lists of up to batch
+        # candles; the stream is stopped when the last consumer leaves
+        subscriber = await self.addCandleSubscriber(symbol, None, **options)
+        try:
+            while True:
+                yield await self.__nextItem(subscriber, batch)
+        finally:
+            await self.removeCandleSubscriber(symbol, subscriber)
+
+    async def __iterateStream(self, stream: str, batch: Optional[int], **options):
+        # trades, profits and balances stay subscribed for the position book
+        options.setdefault("key", CONFLATION_KEYS[stream])
+        subscriber = self.dispatcher.subscribe(stream, None, **options)
+        try:
+            while True:
+                yield await self.__nextItem(subscriber, batch)
+        finally:
+            self.dispatcher.unsubscribe(stream, subscriber)
+
+    def trades(self, batch: Optional[int] = None, **options):
+        return self.__iterateStream("trade", batch, **options)
+
+    def profits(self, batch: Optional[int] = None, **options):
+        return self.__iterateStream("profit", batch, **options)
+
+    def balances(self, batch: Optional[int] = None, **options):
+        return self.__iterateStream("balance", batch, **options)
+
+    async def getCandles(self, symbol: str, period: int, start: int) -> CandleSeries:
+        if not self.candle_cache:
+            return await self.fetchCandles(symbol, period, start)
+
+        for missing_start, missing_end in self.candle_cache.missing_ranges(
+            symbol, period, start
+        ):
+            fetched_at = math.floor(time.time() * 1000)
+            series = await self.fetchCandles(symbol, period, missing_start, missing_end)
+            self.candle_cache.store(series, missing_start, missing_end or fetched_at)
+
+        return self.candle_cache.load(symbol, period, start) or CandleSeries(
+            symbol, period
         )
 
-        return [Candle(**candle) for candle in data["rateInfos"]]
+    async def fetchCandles(
+        self, symbol: str, period: int, start: int, end: Optional[int] = None
+    ) -> CandleSeries:
+        # always from the server, bypassing the candle cache
+        if end is None:
+            command = GetChartLastRequestCommand(
+                symbol=symbol, period=period, start=start
+            )
+        else:
+            command = GetChartRangeRequestCommand(
+                symbol=symbol, period=period, start=start, end=end
+            )
+        data = await self.__doCommand(command)
+
+        return CandleSeries.from_rate_infos(
+            symbol, period, data["rateInfos"], data["digits"]
+        )
 
     async def getServerTime(self):
         return await self.__doCommand(GetServerTimeCommand)
@@ -272,8 +946,123 @@ class XTB:
 
         return result.margin
 
+    async def marginCalculator(
+        self, symbols: Iterable[str] = (), stream_quotes: bool = True
+    ) -> MarginCalculator:
+        # loads the specs and conversion pairs the symbols need; with
+        # stream_quotes their prices come from tick streams instead of the
+        # quotes cached with the specs
+        if self.account_currency is None:
+            self.account_currency = (await self.getMarginLevel()).currency
+        calculator = MarginCalculator(
+            self.symbol_cache, self.quotes, self.account_currency
+        )
+
+        symbols = list(dict.fromkeys(symbols))
+        specs = await self.__loadSpecs(symbols)
+        if specs.errors:
+            raise Exception(f"Could not load symbols: {list(specs.errors)}")
+        calculator.specs.update(specs)
+
+        # only one pair of each currency exists, the other lookups fail
+        pairs = calculator.conversion_symbols(symbols)
+        calculator.specs.update(await self.__loadSpecs(pairs))
+        pairs = [s for s in pairs if s in calculator.specs]
+
+        if stream_quotes:
+            for symbol in symbols + pairs:
+                if symbol not in self.tick_subscriptions:
+                    await self.startTickStream(symbol)
+        return calculator
+
+    async def __loadSpecs(self, symbols: List[str]) -> BatchResult:
+        # cached specs plus the missing ones, taken from the fetch result
+        # rather than read back from the cache, which may have evicted them
+        batch = BatchResult()
+        missing = []
+        for symbol in symbols:
+            record = self.symbol_cache.get(symbol)
+            if record is None:
+                missing.append(symbol)
+            else:
+                batch[symbol] = record
+        if missing:
+            fetched = await self.getSymbols(missing)
+            batch.update(fetched)
+            batch.errors = fetched.errors
+        return batch
+
     async def getSymbol(self, symbol: str) -> SymbolRecord:
-        return await self.__doCommand(GetSymbolCommand(symbol=symbol))
+        record = await self.__doCommand(GetSymbolCommand(symbol=symbol))
+        self.symbol_cache.put(record)
+        return record
+
+    async def getSymbolSpec(self, symbol: str) -> SymbolRecord:
+        # contract size, leverage, currency and lot limits; the quote fields
+        # of the returned record may be stale
+        record = self.symbol_cache.get(symbol)
+        if record is None:
+            record = await self.getSymbol(symbol)
+        return record
+
+    async def getAllSymbols(self) -> List[SymbolRecord]:
+        records = await self.__doCommand(GetAllSymbolsCommand)
+        self.symbol_cache.preload(records)
+        return records
+
+    async def preloadSymbols(self):
+        await self.getAllSymbols()
+
+    async def __gatherBatch(self, keys: list, coroutines: list) -> BatchResult:
+        results = await asyncio.gather(*coroutines, return_exceptions=True)
+
+        batch = BatchResult()
+        for key, result in zip(keys, results):
+            if isinstance(result, Exception):
+                batch.errors[key] = result
+            else:
+                batch[key] = result
+        return batch
+
+    async def getSymbols(
+        self, symbols: Iterable[str], bulk: Optional[bool] = None
+    ) -> BatchResult:
+        symbols = list(dict.fromkeys(symbols))
+        if bulk is None:
+            bulk = len(symbols) > self.bulk_symbol_threshold
+
+        if not bulk:
+            return await self.__gatherBatch(
+                symbols, [self.getSymbol(symbol) for symbol in symbols]
+            )
+
+        batch = BatchResult()
+        try:
+            index = {record.symbol: record for record in await self.getAllSymbols()}
+        except Exception as e:
+            batch.errors = {symbol: e for symbol in symbols}
+            return batch
+
+        for symbol in symbols:
+            if symbol in index:
+                batch[symbol] = index[symbol]
+            else:
+                batch.errors[symbol] = Exception(f"Unknown symbol: {symbol}")
+        return batch
+
+    async def getMarginTrades(self, volumes: Dict[str, float]) -> BatchResult:
+        return await self.__gatherBatch(
+            list(volumes),
+            [self.getMarginTrade(symbol, volume) for symbol, volume in volumes.items()],
+        )
+
+    async def getCandlesMany(
+        self, symbols: Iterable[str], period: int, start: int
+    ) -> BatchResult:
+        symbols = list(dict.fromkeys(symbols))
+        return await self.__gatherBatch(
+            symbols, [self.getCandles(symbol, period, start) for symbol in symbols]
+        )
 
     async def buy(self, symbol: str, volume: float) -> XTBPosition:
         result: TradeTransactionResult = await self.__doCommand(
@@ -299,6 +1088,42 @@ class XTB:
         position: StreamingTradeRecord = await self.__waitForTrade(result.order)
         return position
 
+    async def __executeLeg(
+        self, leg: OrderLeg, timeout: Optional[float], started: float
+    ) -> LegResult:
+        result = LegResult(leg=leg)
+        try:
+            response: TradeTransactionResult = await self.__doCommand(
+                TradeTransactionCommand(
+                    tradeTransInfo=TradeTransInfo(
+                        leg.operation, OrderType.OPEN, leg.symbol, leg.volume
+                    )
+                )
+            )
+            result.order = response.order
+            result.ack_latency = time.monotonic() - started
+
+            result.position = await self.__waitForTrade(response.order, timeout)
+            result.fill_latency = time.monotonic() - started
+            result.status = FILLED
+        except asyncio.TimeoutError:
+            result.status = TIMED_OUT
+        except Exception as e:
+            result.status = REJECTED
+            result.error = e
+        return result
+
+    async def executeBasket(
+        self, legs: List[OrderLeg], timeout: Optional[float] = 30
+    ) -> BasketResult:
+        # every leg is sent right away; pacing is left to the trade limiter
+        # and fills are tracked concurrently
+        started = time.monotonic()
+        results = await asyncio.gather(
+            *[self.__executeLeg(leg, timeout, started) for leg in legs]
+        )
+        return BasketResult(list(results), time.monotonic() - started)
+
     async def close(self, position: int, volume: Optional[float] = None):
         pos = self.positions[position]
         await self.__doCommand(